@@ -1,16 +1,46 @@
-from flask import Flask, render_template_string, Response, jsonify, request
+from flask import Flask, Request, render_template_string, Response, jsonify, request, abort, send_file
 import cv2
 import threading
 import time
 from datetime import datetime
-from ultralytics import YOLO
 import numpy as np
-import queue
+import io
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import zipfile
 import os
+import re
+from urllib.parse import urlsplit
 from werkzeug.utils import secure_filename
+from inference import InferenceScheduler
+from backends import Detections, load_backend
+from cache import ResultCache
+from storage import IMAGE_EXTS, UploadStore, content_digest, image_ext
+from knowledge import KnowledgeBase
+from postprocess import ClassTable, detection_records
+from render import draw_detections, annotated_preview
+from pipeline import LatestSlot, SceneChangeDetector
+from streaming import Broadcaster
+from tracking import FlowTracker
+from sources import FrameSource, display_source, source_kind
+from tiling import merge_tiles, tile_inputs
+from ingest import decode_image
+from formats import FORMATS, MSGPACK_MIMETYPE, FastJSONProvider, dumps, msgpack, packb, shape_detections
+
+# Keep uploaded files in memory instead of spooling large ones to a temp file;
+# routes that take large bodies (/upload_batch) set spool_files to spool as usual
+class InMemoryRequest(Request):
+    spool_files = False
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.spool_files:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return io.BytesIO()
 
 # Create app
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+app.json = FastJSONProvider(app)
+app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024
 
 # Uploads folder
 UPLOAD_FOLDER = 'uploads'
@@ -18,96 +48,156 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Global variables
-frame_queue = queue.Queue(maxsize=2)
-detections = []
-model_obj = {'model': None, 'loading': False, 'loaded': False}
-stop_event = threading.Event()
-camera_thread = None
+model_obj = {'model': None, 'loading': False, 'loaded': False, 'backend': None, 'version': None,
+             'error': None, 'load_seconds': None, 'warmup_ms': [], 'classes': None}
+cameras = {}
 camera_lock = threading.Lock()
 
-# Disease diagnosis and remedy dictionary
-disease_info = {
-    "Tomato_Yellow_Leaf_Curl_Virus": {
-        "diagnosis": "A viral disease spread by whiteflies, causing curling and yellowing of leaves with stunted growth.",
-        "remedy": "Remove infected plants, control whiteflies using sticky traps or neem oil, and plant resistant varieties."
-    },
-    "Tomato_Mosaic_Virus": {
-        "diagnosis": "Viral infection leading to mottled, discolored leaves and reduced fruit quality.",
-        "remedy": "Remove infected plants, disinfect tools, and wash hands before handling plants (avoid tobacco exposure)."
-    },
-    "Tomato_Target_Spot": {
-        "diagnosis": "Fungal disease causing brown concentric spots on leaves and fruit.",
-        "remedy": "Prune lower leaves, improve air circulation, and apply copper-based fungicide."
-    },
-    "Tomato_Spider_Mites": {
-        "diagnosis": "Tiny mites that cause yellow stippling and webbing on leaves.",
-        "remedy": "Spray leaves with water, neem oil, or insecticidal soap. Encourage natural predators like ladybugs."
-    },
-    "Tomato_Septoria_Leaf_Spot": {
-        "diagnosis": "Fungal infection causing small circular spots with dark borders on lower leaves.",
-        "remedy": "Remove infected leaves, avoid wetting foliage, and apply fungicide like mancozeb or chlorothalonil."
-    },
-    "Tomato_Leaf_Mold": {
-        "diagnosis": "High humidity fungal disease causing yellow spots and mold growth on leaves' underside.",
-        "remedy": "Increase ventilation, reduce humidity, and treat with sulfur or copper fungicides."
-    },
-    "Tomato_Late_Blight": {
-        "diagnosis": "Serious fungal disease causing dark, water-soaked lesions on leaves and fruit.",
-        "remedy": "Destroy infected plants, avoid overhead watering, and apply fungicides containing chlorothalonil."
-    },
-    "Tomato_Healthy": {
-        "diagnosis": "No signs of disease. Plant appears healthy and vigorous.",
-        "remedy": "Continue regular care—ensure balanced nutrients and pest monitoring."
-    },
-    "Tomato_Early_Blight": {
-        "diagnosis": "Fungal disease causing dark, concentric leaf spots that start on lower leaves.",
-        "remedy": "Remove affected leaves, rotate crops, and spray with fungicides like mancozeb."
-    },
-    "Tomato_Bacterial_Spot": {
-        "diagnosis": "Bacterial infection causing water-soaked lesions on leaves and fruits.",
-        "remedy": "Avoid overhead watering, use copper-based bactericides, and destroy infected debris."
-    },
-    "Potato_Healthy": {
-        "diagnosis": "No visible infection detected. Plant is healthy.",
-        "remedy": "Maintain good soil health, avoid overwatering, and monitor for pests."
-    },
-    "Potato_Late_Blight": {
-        "diagnosis": "Serious fungal disease leading to dark lesions and tuber rot.",
-        "remedy": "Remove infected plants, avoid wet foliage, and use preventive fungicides regularly."
-    },
-    "Potato_Early_Blight": {
-        "diagnosis": "Dark spots with concentric rings that lead to leaf drop.",
-        "remedy": "Remove infected leaves, apply fungicide, and ensure crop rotation."
-    },
-    "Corn_Healthy": {
-        "diagnosis": "No disease detected.",
-        "remedy": "Maintain field hygiene, balanced nutrition, and adequate spacing."
-    },
-    "Corn_Gray_Leaf_Spot": {
-        "diagnosis": "Gray or tan rectangular lesions caused by Cercospora fungus.",
-        "remedy": "Use resistant hybrids, rotate crops, and apply fungicides at early tasseling."
-    },
-    "Corn_Common_Rust": {
-        "diagnosis": "Small reddish-brown pustules on both sides of leaves.",
-        "remedy": "Use rust-resistant hybrids and apply fungicides when infection is severe."
-    },
-    "Corn_Blight": {
-        "diagnosis": "Fungal leaf disease causing elongated gray or tan lesions that reduce yield.",
-        "remedy": "Use resistant varieties, rotate crops, and remove infected residues."
-    },
-    "Rice_Brown_Spot": {
-        "diagnosis": "Fungal disease causing small brown spots on leaves and grains.",
-        "remedy": "Apply balanced fertilizers, improve drainage, and spray fungicide if needed."
-    },
-    "Rice_Leaf_Smut": {
-        "diagnosis": "Fungal infection forming black, dusty smut balls on leaves.",
-        "remedy": "Use disease-free seeds, avoid excessive nitrogen fertilizer, and treat with carbendazim."
-    },
-    "Rice_Bacterial_Leaf_Blight": {
-        "diagnosis": "Bacterial disease causing yellowing and wilting of leaves from tip downward.",
-        "remedy": "Use resistant varieties, avoid mechanical injury, and apply copper-based bactericide."
-    },
+# Model backend: 'ultralytics' (PyTorch), 'onnx' (ONNX Runtime), 'saved_model' or 'tflite'
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'ultralytics')
+MODEL_PATH = os.environ.get('MODEL_PATH', 'best.pt')
+
+# `python app.py` runs with the debug reloader, which imports this module twice:
+# in the parent that only watches files and restarts the server, and in the
+# child that serves requests. Only the child loads the model and starts the
+# background threads.
+USE_RELOADER = True
+START_WORKERS = not (__name__ == '__main__' and USE_RELOADER and os.environ.get('WERKZEUG_RUN_MAIN') != 'true')
+
+# Originals are decoded in memory; saving them to disk is optional and off-request
+# (written by the output pool below)
+SAVE_ORIGINALS = True
+
+# Uploads and annotated images are stored under content hashes with a size/age budget
+STORE_MAX_BYTES = 2 * 1024 ** 3
+STORE_MAX_AGE = 7 * 24 * 3600
+upload_store = UploadStore(UPLOAD_FOLDER, STORE_MAX_BYTES, STORE_MAX_AGE)
+
+# Annotated images are drawn, encoded and written off the request path;
+# a GET for one that is still pending waits for it
+render_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='render')
+pending_outputs = {}
+pending_lock = threading.Lock()
+RENDER_WAIT_TIMEOUT = 10
+# Longest side of annotated upload images; None keeps the full resolution,
+# e.g. 1280 turns multi-megapixel field photos into quick-to-load previews
+ANNOTATED_MAX_SIDE = None
+
+# Upload results cached by content hash + model version + threshold
+UPLOAD_CONF = 0.5
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_MAX_AGE = 3600
+result_cache = ResultCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_MAX_AGE)
+
+# Tiled inference for large field photos: above TILE_THRESHOLD px (longest side)
+# an upload is also run as overlapping TILE_SIZE crops, batched together with
+# the full-image pass, so small lesions keep their resolution; the results are
+# merged with a cross-tile NMS on intersection-over-smaller-box
+TILED_INFERENCE = True
+TILE_THRESHOLD = 1600
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2
+TILE_MERGE_THRESHOLD = 0.5
+
+# JPEG uploads are decoded directly at 1/2, 1/4 or 1/8 size (DCT scaling) when
+# the model would shrink them anyway, keeping the longest side >= DECODE_TARGET_SIZE,
+# and turned upright from their EXIF orientation. Photos that will be tiled
+# (longest side above TILE_THRESHOLD) need every pixel and are decoded at full
+# size, so with tiling on this only shrinks uploads up to TILE_THRESHOLD
+REDUCED_DECODE = True
+DECODE_TARGET_SIZE = 640
+upload_timing = {'standard': {'count': 0, 'total_ms': 0.0}, 'tiled': {'count': 0, 'total_ms': 0.0, 'tiles': 0}}
+timing_lock = threading.Lock()
+
+# Disease text comes from disease_info.json, keyed by the model's class names;
+# edits to the file are picked up within KNOWLEDGE_CHECK_INTERVAL seconds
+KNOWLEDGE_CHECK_INTERVAL = 5
+knowledge = KnowledgeBase()
+knowledge.load()
+
+# Dummy inferences run before the model is marked loaded
+WARMUP_RUNS = 3
+
+# Micro-batching: requests arriving within BATCH_MAX_WAIT_MS share one forward pass
+BATCH_MAX_SIZE = 8
+BATCH_MAX_WAIT_MS = 10
+
+# Live mode: show every camera frame, run the detector only every N frames and
+# move boxes in between with optical flow; N adapts so the detector stays under
+# INFER_TARGET_FPS and never falls behind its own latency
+CAMERA_TRACKING = True
+INFER_TARGET_FPS = 5
+
+# Reuse the last detections while the camera image stays (nearly) the same;
+# the threshold is the mean absolute difference of a 32x24 gray thumbnail
+SCENE_GATING = True
+SCENE_CHANGE_THRESHOLD = 4.0
+SCENE_MAX_REUSE = 5.0
+
+# Cameras: id -> source (webcam index, video file or rtsp:// / http:// URL); more can be
+# given as CAMERA_SOURCES="row1=0,row2=rtsp://10.0.0.12/stream1"
+DEFAULT_CAMERA = 'default'
+MAX_CAMERAS = 8
+CAMERA_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+def parse_camera_source(source):
+    source = source.strip()
+    return int(source) if source.isdigit() else source
+
+CAMERA_SOURCES = {DEFAULT_CAMERA: 0}
+for item in filter(None, os.environ.get('CAMERA_SOURCES', '').split(',')):
+    cam_id, _, source = item.partition('=')
+    CAMERA_SOURCES[cam_id.strip()] = parse_camera_source(source)
+
+# /cameras/<id>/start?source=... is refused unless CAMERA_CUSTOM_SOURCES is on, and
+# then only opens video files under CAMERA_FILE_ROOTS or stream URLs whose host is
+# in CAMERA_URL_HOSTS (never webcams or other local devices)
+CAMERA_CUSTOM_SOURCES = False
+CAMERA_FILE_ROOTS = []
+CAMERA_URL_HOSTS = set()
+
+def allowed_camera_source(source):
+    if not CAMERA_CUSTOM_SOURCES or isinstance(source, int):
+        return False
+    if '://' in source:
+        parts = urlsplit(source)
+        return parts.scheme in ('rtsp', 'rtsps', 'http', 'https') and parts.hostname in CAMERA_URL_HOSTS
+    path = os.path.realpath(source)
+    if not os.path.isfile(path):
+        return False
+    roots = [os.path.realpath(root) for root in CAMERA_FILE_ROOTS]
+    return any(os.path.commonpath([path, root]) == root for root in roots)
+
+# Video files play in real time ('realtime') or as fast as the pipeline takes
+# frames ('fast', for benchmarking); dropped streams are reopened with backoff
+CAMERA_PACING = 'realtime'
+CAMERA_LOOP = False
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+# /video_feed?profile=...: each profile is encoded at most once per frame, only
+# while someone watches it, and shared by all of its viewers. 'auto' starts at
+# full and steps a viewer down while it keeps missing frames, then tries the
+# next larger profile again after STREAM_UPGRADE_AFTER seconds without misses.
+STREAM_PROFILES = {
+    'full': {'scale': 1.0, 'quality': 90},
+    'half': {'scale': 0.5, 'quality': 75},
+    'thumb': {'scale': 0.25, 'quality': 60}
 }
+STREAM_DEFAULT_PROFILE = 'full'
+STREAM_UPGRADE_AFTER = 10.0
+
+# /detections/stream pushes a camera's detections when what clients receive
+# (class ids, rounded confidences, boxes) changes, at most once per interval
+DETECTIONS_MIN_INTERVAL = 1.0
+
+# Batch uploads: files (or zip members) per request and images in flight at once;
+# batches have their own body limit (each image still has MAX_CONTENT_LENGTH)
+BATCH_MAX_FILES = 500
+BATCH_MAX_CONTENT_LENGTH = 2 * 1024 ** 3
+BATCH_WINDOW = 2 * BATCH_MAX_SIZE
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_WINDOW, thread_name_prefix='batch')
 
 # HTML template with updated live detection display
 HTML_TEMPLATE = '''<!DOCTYPE html>
@@ -561,7 +651,7 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                 <div id="status" class="status" style="display: none;"></div>
                 
                 <div class="video-container">
-                    <img id="video" src="/video_feed" alt="Camera feed will appear here">
+                    <img id="video" src="/video_feed?profile=auto" alt="Camera feed will appear here">
                 </div>
                 
                 <div class="detections-container">
@@ -630,46 +720,71 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             }
         }
 
-        // Poll detections with diagnosis and remedy display
+        // Render live detections with diagnosis and remedy display
+        function renderDetections(list) {
+            const detectionsDiv = document.getElementById("detections");
+            
+            if (list && list.length > 0) {
+                let html = '';
+                list.forEach((det, index) => {
+                    html += `
+                        <div class="live-disease-item">
+                            <div class="live-disease-name">
+                                🦠 ${det.class}
+                                <span class="live-confidence-badge">${(det.confidence * 100).toFixed(1)}%</span>
+                            </div>
+                            <div class="live-section">
+                                <div class="live-section-title">🔬 Diagnosis:</div>
+                                <div class="live-section-content">${det.diagnosis || 'Information not available'}</div>
+                            </div>
+                            <div class="live-section">
+                                <div class="live-section-title">💊 Remedy:</div>
+                                <div class="live-section-content">${det.remedy || 'Information not available'}</div>
+                            </div>
+                        </div>
+                    `;
+                });
+                detectionsDiv.innerHTML = html;
+            } else {
+                detectionsDiv.innerHTML = '<div class="no-detection-message">👀 No diseases detected</div>';
+            }
+        }
+        
+        // Fallback for browsers without EventSource: poll once a second
         async function pollDetections() {
             while(true) {
                 try {
                     const response = await fetch('/detections');
                     const data = await response.json();
-                    
-                    const detectionsDiv = document.getElementById("detections");
-                    
-                    if (data.detections && data.detections.length > 0) {
-                        let html = '';
-                        data.detections.forEach((det, index) => {
-                            html += `
-                                <div class="live-disease-item">
-                                    <div class="live-disease-name">
-                                        🦠 ${det.class}
-                                        <span class="live-confidence-badge">${(det.confidence * 100).toFixed(1)}%</span>
-                                    </div>
-                                    <div class="live-section">
-                                        <div class="live-section-title">🔬 Diagnosis:</div>
-                                        <div class="live-section-content">${det.diagnosis || 'Information not available'}</div>
-                                    </div>
-                                    <div class="live-section">
-                                        <div class="live-section-title">💊 Remedy:</div>
-                                        <div class="live-section-content">${det.remedy || 'Information not available'}</div>
-                                    </div>
-                                </div>
-                            `;
-                        });
-                        detectionsDiv.innerHTML = html;
-                    } else {
-                        detectionsDiv.innerHTML = '<div class="no-detection-message">👀 No diseases detected</div>';
-                    }
+                    renderDetections(data.detections);
                 } catch (error) {
                     document.getElementById("detections").innerHTML = `<div class="no-detection-message" style="color: #ff6b6b;">❌ Connection error: ${error.message}</div>`;
                 }
                 await new Promise(resolve => setTimeout(resolve, 1000));
             }
         }
-        pollDetections();
+        
+        // Server pushes updates only when detections change; class text arrives
+        // once in a 'classes' event and detections refer to it by class_id
+        function streamDetections() {
+            const classes = {};
+            const source = new EventSource('/detections/stream');
+            source.addEventListener('classes', (e) => Object.assign(classes, JSON.parse(e.data)));
+            source.addEventListener('detections', (e) => {
+                const data = JSON.parse(e.data);
+                renderDetections(data.detections.map(det => {
+                    const info = classes[det.class_id] || {};
+                    return {class: info.name || det.class_id, confidence: det.confidence,
+                            diagnosis: info.diagnosis, remedy: info.remedy};
+                }));
+            });
+        }
+        
+        if (window.EventSource) {
+            streamDetections();
+        } else {
+            pollDetections();
+        }
 
         // Enhanced upload form
         document.getElementById("uploadForm").addEventListener("submit", async function(e) {
@@ -741,7 +856,7 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                             <div class="results-grid">
                                 <div class="result-item">
                                     <div class="result-label">📷 Original Image</div>
-                                    <img src="${data.input_image}" class="result-image" alt="Original image">
+                                    <img src="${data.input_image || URL.createObjectURL(formData.get('file'))}" class="result-image" alt="Original image">
                                 </div>
                                 <div class="result-item">
                                     <div class="result-label">🎯 Detection Results</div>
@@ -786,105 +901,394 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
 </html>''' 
 
 # Model loading
-def load_model_async(model_path='best.pt'):
+def load_model_async(model_path=MODEL_PATH, backend=MODEL_BACKEND):
     if model_obj['loaded'] or model_obj['loading']:
         return
     model_obj['loading'] = True
     def _loader():
         try:
-            print("Loading YOLO model...")
-            model = YOLO(model_path)
+            print(f"Loading YOLO model ({backend} backend)...")
+            start = time.perf_counter()
+            model = load_backend(backend, model_path)
+            model_obj['load_seconds'] = time.perf_counter() - start
+            model_obj['warmup_ms'] = warmup_model(model)
+            model_obj['backend'] = backend
+            model_obj['version'] = f"{backend}:{os.path.abspath(model_path)}:{os.path.getmtime(model_path):.0f}"
+            model_obj['error'] = None
+            model_obj['classes'] = build_class_table(model)
             model_obj['model'] = model
             model_obj['loaded'] = True
-            print("Model loaded successfully!")
+            print(f"Model loaded successfully! (load {model_obj['load_seconds']:.2f}s, "
+                  f"warm-up {', '.join(f'{t:.0f}' for t in model_obj['warmup_ms'])} ms)")
         except Exception as e:
+            model_obj['error'] = str(e)
             print(f"Model load error: {e}")
         finally:
             model_obj['loading'] = False
     threading.Thread(target=_loader, daemon=True).start()
 
-# Camera thread
+def build_class_table(model):
+    # Class-id indexed records; warn about classes the knowledge base doesn't cover
+    table = ClassTable(model.names, knowledge)
+    if table.missing:
+        print(f"No disease info for: {', '.join(table.missing)}")
+    if table.unused:
+        print(f"Disease info entries matching no model class: {', '.join(table.unused)}")
+    return table
+
+def watch_knowledge():
+    while True:
+        time.sleep(KNOWLEDGE_CHECK_INTERVAL)
+        if not knowledge.changed() or not knowledge.load():
+            continue
+        print("Reloaded disease info")
+        if model_obj['model'] is not None:
+            model_obj['classes'] = build_class_table(model_obj['model'])
+
+if START_WORKERS:
+    threading.Thread(target=watch_knowledge, daemon=True, name='knowledge-watch').start()
+
+def warmup_model(model):
+    # Pay for lazy graph setup before real traffic: single images, then a full batch
+    dummy = np.zeros((480, 640, 3), dtype=np.uint8)
+    timings = []
+    for batch_size in [1] * WARMUP_RUNS + [BATCH_MAX_SIZE]:
+        start = time.perf_counter()
+        model.predict([dummy] * batch_size, conf=0.5)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def store_file(key, data):
+    try:
+        upload_store.put(key, data)
+    except OSError as e:
+        print(f"Failed to store {key}: {e}")
+
+def upload_version():
+    # Everything besides the image that changes upload results
+    tiling = f"tiles-{TILE_THRESHOLD}-{TILE_SIZE}-{TILE_OVERLAP}-{TILE_MERGE_THRESHOLD}" if TILED_INFERENCE else 'full'
+    decode = f"reduced-{DECODE_TARGET_SIZE}" if REDUCED_DECODE else 'full'
+    return f"{model_obj['version']}:{tiling}:{decode}"
+
+def annotated_variant():
+    # Annotated images depend on the model, threshold and output size as well as the input
+    return 'annotated-' + content_digest(f"{upload_version()}:{UPLOAD_CONF}:{ANNOTATED_MAX_SIDE}".encode())[:8]
+
+def schedule_output(filename, fn, *args):
+    future = render_pool.submit(fn, *args)
+    with pending_lock:
+        pending_outputs[filename] = future
+    def _done(f):
+        with pending_lock:
+            if pending_outputs.get(filename) is f:
+                del pending_outputs[filename]
+    future.add_done_callback(_done)
+    return future
+
+def output_pending(filename):
+    with pending_lock:
+        return filename in pending_outputs
+
+def render_annotated(image, det, names, ext, output_key, cache_key):
+    # The decoded upload isn't used again, so full-size output is drawn in place
+    if ANNOTATED_MAX_SIDE:
+        annotated = annotated_preview(image, det, names, ANNOTATED_MAX_SIDE)
+    else:
+        annotated = draw_detections(image, det, names)
+    ok, buf = cv2.imencode(ext, annotated)
+    if not ok:
+        print(f"Could not encode annotated image {output_key}")
+        return
+    annotated_bytes = buf.tobytes()
+    store_file(output_key, annotated_bytes)
+    result_cache.attach(cache_key, annotated_bytes)
+
+def predict_batch(images, conf):
+    model = model_obj['model']
+    if model is None:
+        raise RuntimeError("YOLO model not loaded yet")
+    return model.predict(images, conf=conf)
+
+# Single owner of the model; camera frames and uploads are both queued here
+scheduler = InferenceScheduler(predict_batch, max_batch=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+if START_WORKERS:
+    scheduler.start()
+
+# Load and warm the model at startup instead of on the first /start_camera
+if START_WORKERS:
+    load_model_async()
+
+def new_camera_feed():
+    # Per-camera outputs; they outlive the camera thread so viewers stay
+    # connected across a stop/start
+    return {'frames': {name: Broadcaster() for name in STREAM_PROFILES}, 'detections': Broadcaster(), 'latest': [],
+            'sent': [], 'sent_at': 0.0}
+
+camera_feeds = {DEFAULT_CAMERA: new_camera_feed()}
+
+def publish_detections(feed, local_detections, names):
+    # Serialized once per change and shared by all SSE clients; detections only
+    # carry a class id, the class text goes out separately the first time.
+    # A change inside the interval is picked up by the first inference after it.
+    compact = [{'class_id': d['class_id'], 'confidence': round(d['confidence'], 3), 'bbox': d['bbox']}
+               for d in local_detections]
+    now = time.monotonic()
+    if compact == feed['sent'] or now - feed['sent_at'] < DETECTIONS_MIN_INTERVAL:
+        return
+    feed['sent'], feed['sent_at'] = compact, now
+    data = dumps({'detections': compact, 'count': len(compact), 'timestamp': datetime.now().isoformat()}).decode()
+    classes = {d['class_id']: d['class'] for d in local_detections}
+    feed['detections'].publish((data, classes))
+
+# One inference worker serves every camera: each round takes the newest
+# pending frame from each running camera and submits them back to back, so
+# the scheduler runs them as a single batched forward pass
+camera_frames_ready = threading.Event()
+camera_infer_stats = {'rounds': 0, 'frames': 0, 'max_frames': 0}
+
+def camera_inference_loop():
+    while True:
+        camera_frames_ready.wait(timeout=0.5)
+        camera_frames_ready.clear()
+        with camera_lock:
+            active = [cam for cam in cameras.values() if cam.running]
+        pending = []
+        loaded = model_obj['loaded'] and model_obj['model']
+        for cam in active:
+            frame = cam.next_infer_frame()
+            if frame is not None:
+                pending.append((cam, frame, scheduler.submit(frame, conf=cam.conf) if loaded else None))
+        if not pending:
+            continue
+        start = time.perf_counter()
+        for cam, frame, future in pending:
+            det = None
+            if future is not None:
+                try:
+                    det = future.result()
+                except Exception as e:
+                    print(f"Detection error ({cam.cam_id}): {e}")
+            cam.deliver(frame, det, time.perf_counter() - start)
+        camera_infer_stats['rounds'] += 1
+        camera_infer_stats['frames'] += len(pending)
+        camera_infer_stats['max_frames'] = max(camera_infer_stats['max_frames'], len(pending))
+
+if START_WORKERS:
+    threading.Thread(target=camera_inference_loop, daemon=True, name='camera-inference').start()
+
+# Camera pipeline: capture and encode run in the camera's own threads, inference
+# in the shared camera worker; stages hand frames over through latest-value
+# slots, so a slow stage drops stale frames instead of delaying everything behind it
 class CameraThread(threading.Thread):
-    def __init__(self, camera_id=0, conf=0.5):
-        super().__init__(daemon=True)
-        self.camera_id = camera_id
+    def __init__(self, cam_id=DEFAULT_CAMERA, source=0, feed=None, conf=0.5, pacing=None, loop=None):
+        super().__init__(daemon=True, name=f'camera-{cam_id}')
+        self.cam_id = cam_id
+        self.source = source
+        self.pacing = pacing or CAMERA_PACING
+        self.loop = CAMERA_LOOP if loop is None else loop
+        self.feed = feed if feed is not None else new_camera_feed()
         self.conf = conf
         self.cap = None
         self.running = False
+        # Set by stop(); lets a stop that comes in while the source is still
+        # opening (seconds for RTSP) win over run() setting running afterwards
+        self.stop_event = threading.Event()
+        # A fast file replay is a benchmark: every frame goes through the
+        # detector (no scene gating or tracking) and the encoder, each stage
+        # waiting for the next to take it
+        self.lockstep = self.pacing == 'fast' and source_kind(source) == 'file'
+        self.tracking = CAMERA_TRACKING and not self.lockstep
+        self.infer_frames = LatestSlot()  # capture -> inference
+        self.results = LatestSlot()       # inference -> encode
+        self.frames = LatestSlot()        # capture -> encode (tracking mode only)
+        self.counts = {'captured': 0, 'inferred': 0, 'encoded': 0}
+        self.started_at = None
+        self.stopped_at = None
+        self.frame_interval = 1 / 30.0
+        self.infer_latency = 0.0
+        self.infer_every = 1
+        self.scene = SceneChangeDetector(SCENE_CHANGE_THRESHOLD, max_reuse=SCENE_MAX_REUSE) if SCENE_GATING and not self.lockstep else None
+        self.infer_seq = 0
+        self.last = None
 
     def run(self):
+        worker = None
         try:
-            self.cap = cv2.VideoCapture(self.camera_id)
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            time.sleep(0.2)
-            
-            if not self.cap.isOpened():
-                print("Camera failed to open")
+            self.cap = FrameSource(self.source, self.pacing, self.loop, RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY)
+            if not self.cap.open():
+                print(f"Camera {self.cam_id} failed to open")
+                # Don't hold a slot (or report a camera) that never ran
+                with camera_lock:
+                    if cameras.get(self.cam_id) is self:
+                        del cameras[self.cam_id]
                 return
-                
+
             self.running = True
-            print("Camera thread started")
+            if self.stop_event.is_set():
+                print(f"Camera {self.cam_id} stopped while opening")
+                return
+            self.started_at = time.monotonic()
+            encode_loop = self._track_encode_loop if self.tracking else self._encode_loop
+            worker = threading.Thread(target=encode_loop, daemon=True)
+            worker.start()
+            print(f"Camera {self.cam_id} started")
             
-            while self.running and not stop_event.is_set():
-                ret, frame = self.cap.read()
-                if not ret:
-                    time.sleep(0.01)
+            # Capture stage: take each frame the source's decode thread delivers
+            last = time.perf_counter()
+            since_infer = 0
+            while self.running:
+                frame = self.cap.read(timeout=0.5)
+                if frame is None:
+                    if self.cap.ended:
+                        print(f"Camera {self.cam_id}: end of {display_source(self.source)}")
+                        if self.lockstep:
+                            self._drain()
+                        break
                     continue
-
-                annotated = frame.copy()
-                local_detections = []
-
-                if model_obj['loaded'] and model_obj['model']:
-                    try:
-                        results = model_obj['model'](frame, conf=self.conf, verbose=False)
-                        for res in results:
-                            boxes = res.boxes
-                            if boxes is not None:
-                                for box in boxes:
-                                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                                    conf_val = float(box.conf[0])
-                                    cls = int(box.cls[0])
-                                    name = model_obj['model'].names.get(cls, str(cls))
-                                    
-                                    # Include diagnosis & remedy
-                                    info = disease_info.get(name.replace(" ", "_"), {
-                                        'diagnosis': 'Info not available',
-                                        'remedy': 'Info not available'
-                                    })
-                                    
-                                    local_detections.append({
-                                        'class': name,
-                                        'confidence': conf_val,
-                                        'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                                        'diagnosis': info['diagnosis'],
-                                        'remedy': info['remedy']
-                                    })
-                                    
-                                    color = tuple(int(x) for x in np.random.RandomState(cls).randint(0, 255, 3))
-                                    cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-                                    cv2.putText(annotated, f"{name}: {conf_val:.2f}", 
-                                              (x1, max(15, y1-5)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-                    except Exception as e:
-                        print(f"Detection error: {e}")
-
-                global detections
-                detections = local_detections
-
-                ret2, buf = cv2.imencode('.jpg', annotated)
-                if ret2:
-                    if frame_queue.full():
-                        try: frame_queue.get_nowait()
-                        except queue.Empty: pass
-                    frame_queue.put(buf.tobytes())
-                
-                time.sleep(0.03)
+                now = time.perf_counter()
+                self.frame_interval = 0.9 * self.frame_interval + 0.1 * (now - last)
+                last = now
+                self.counts['captured'] += 1
+                if not self.tracking:
+                    if self.lockstep:
+                        while self.running and not self.infer_frames.wait_taken(timeout=0.5):
+                            pass
+                    self.infer_frames.put(frame)
+                    camera_frames_ready.set()
+                    continue
+                self.frames.put(frame)
+                since_infer += 1
+                if since_infer >= self._infer_interval():
+                    # The encode stage draws on the shared frame, so inference gets its own copy
+                    self.infer_frames.put(frame.copy())
+                    camera_frames_ready.set()
+                    since_infer = 0
         finally:
-            if self.cap: self.cap.release()
             self.running = False
-            print("Camera thread stopped")
+            self.infer_frames.close()
+            self.results.close()
+            self.frames.close()
+            if worker:
+                worker.join(timeout=2)
+            if self.cap: self.cap.close()
+            self.stopped_at = time.monotonic()
+            print(f"Camera {self.cam_id} stopped")
+
+    def _drain(self, timeout=5.0):
+        # Let the frames still in flight reach the encoder before shutting down
+        deadline = time.monotonic() + timeout
+        while self.running and self.counts['encoded'] < self.counts['captured'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _infer_interval(self):
+        # Frames between detector runs: enough to respect INFER_TARGET_FPS and
+        # to cover the time one inference takes at the current camera rate
+        capture_fps = 1 / max(self.frame_interval, 1e-6)
+        by_rate = capture_fps / INFER_TARGET_FPS
+        by_latency = self.infer_latency * capture_fps
+        self.infer_every = max(1, int(np.ceil(max(by_rate, by_latency))))
+        return self.infer_every
+
+    def next_infer_frame(self):
+        # Newest frame waiting for the detector, or None. A static scene hands
+        # the previous result on here without going to the model.
+        if self.lockstep and not self.results.wait_taken(timeout=0):
+            # The encoder hasn't taken the last result yet; it signals when it does
+            return None
+        seq, frame = self.infer_frames.get(self.infer_seq, timeout=0)
+        if frame is None:
+            return None
+        self.infer_seq = seq
+        changed = self.scene.changed(frame) if self.scene is not None else True
+        if self.last is not None and not changed:
+            det, names = self.last
+            self.results.put((frame, det, names))
+            return None
+        return frame
+
+    def deliver(self, frame, det, latency):
+        # Called by the camera inference worker with this camera's result
+        local_detections = []
+        names = model_obj['model'].names if det is not None else None
+        if det is not None:
+            # Include diagnosis & remedy
+            local_detections = detection_records(det, model_obj['classes'].camera)
+        self.last = (det, names) if det is not None else None
+        if self.last is None and self.scene is not None:
+            self.scene.invalidate()
+
+        publish_detections(self.feed, local_detections, names)
+        self.feed['latest'] = local_detections
+        self.counts['inferred'] += 1
+        self.infer_latency = 0.8 * self.infer_latency + 0.2 * latency
+        self.results.put((frame, det, names))
+
+    def _encode_loop(self):
+        seq = 0
+        while self.running:
+            seq, item = self.results.get(seq, timeout=0.5)
+            if item is None:
+                continue
+            if self.lockstep:
+                camera_frames_ready.set()
+            frame, det, names = item
+            # Each frame is drawn with its own detections; capture made a fresh
+            # array for it, so drawing in place is safe
+            if det is not None:
+                draw_detections(frame, det, names)
+            self._publish(frame)
+
+    def _track_encode_loop(self):
+        # Every captured frame is shown; boxes come from the latest inference
+        # and are carried forward by the tracker until the next one lands
+        tracker = FlowTracker()
+        seq = result_seq = 0
+        det, names = None, None
+        while self.running:
+            seq, frame = self.frames.get(seq, timeout=0.5)
+            if frame is None:
+                continue
+            new_seq, item = self.results.get(result_seq, timeout=0)
+            if item is not None:
+                result_seq = new_seq
+                infer_frame, det, names = item
+                tracker.reset(infer_frame, det.boxes if det is not None else [])
+            boxes = tracker.update(frame)
+            if det is not None and len(det):
+                draw_detections(frame, Detections(boxes, det.scores, det.class_ids), names)
+            self._publish(frame)
+
+    def _publish(self, frame):
+        # Encoded once per profile here and shared by every viewer of that
+        # profile; the default profile is always kept for /snapshot.jpg
+        for name, profile in STREAM_PROFILES.items():
+            frames = self.feed['frames'][name]
+            if not frames.viewers and name != STREAM_DEFAULT_PROFILE:
+                continue
+            image = frame
+            if profile['scale'] != 1.0:
+                image = cv2.resize(frame, None, fx=profile['scale'], fy=profile['scale'], interpolation=cv2.INTER_AREA)
+            ret2, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, profile['quality']])
+            if ret2:
+                frames.publish(buf.tobytes())
+        self.counts['encoded'] += 1
+
+    def snapshot(self):
+        elapsed = (self.stopped_at or time.monotonic()) - self.started_at if self.started_at else 0
+        stats = {'source': display_source(self.source), 'input': self.cap.snapshot() if self.cap else None,
+                 'running': self.running, 'tracking': self.tracking,
+                 'infer_every': self.infer_every,
+                 'infer_latency_ms': round(self.infer_latency * 1000, 1),
+                 'dropped_before_inference': self.infer_frames.dropped,
+                 'dropped_before_encode': (self.frames if self.tracking else self.results).dropped,
+                 'scene_gating': self.scene.snapshot() if self.scene else None}
+        for stage, count in self.counts.items():
+            stats[stage] = count
+            stats[f'{stage}_fps'] = round(count / elapsed, 2) if elapsed else 0.0
+        return stats
 
     def stop(self):
+        self.stop_event.set()
         self.running = False
 
 # Routes
@@ -892,52 +1296,346 @@ class CameraThread(threading.Thread):
 def index():
     return render_template_string(HTML_TEMPLATE)
 
+@app.route('/healthz')
+def healthz():
+    # Liveness: the process is up and the inference scheduler is still running
+    alive = scheduler.is_alive()
+    return jsonify({'status': 'ok' if alive else 'error', 'scheduler_alive': alive}), 200 if alive else 503
+
+@app.route('/readyz')
+def readyz():
+    # Readiness: the model is loaded and warmed, so requests won't hit a cold worker
+    ready = bool(model_obj['loaded'] and model_obj['model'])
+    return jsonify({
+        'ready': ready,
+        'loading': model_obj['loading'],
+        'backend': model_obj['backend'],
+        'error': model_obj['error'],
+        'load_seconds': model_obj['load_seconds'],
+        'warmup_ms': model_obj['warmup_ms'],
+        'scheduler': scheduler.snapshot()
+    }), 200 if ready else 503
+
+@app.route('/stats')
+def stats():
+    return jsonify({
+        'scheduler': scheduler.snapshot(),
+        'cache': result_cache.snapshot(),
+        'store': upload_store.snapshot(),
+        'upload_inference': upload_timing_snapshot(),
+        'knowledge': dict(knowledge.snapshot(), missing=model_obj['classes'].missing if model_obj['classes'] else None),
+        'camera_inference': dict(camera_infer_stats, avg_frames=round(
+            camera_infer_stats['frames'] / camera_infer_stats['rounds'], 2) if camera_infer_stats['rounds'] else 0.0),
+        'cameras': camera_stats()
+    })
+
+def camera_stats():
+    with camera_lock:
+        return {cam_id: {
+            'camera': cameras[cam_id].snapshot() if cam_id in cameras else None,
+            'stream': {name: frames.snapshot() for name, frames in feed['frames'].items()},
+            'detections_stream': feed['detections'].snapshot()
+        } for cam_id, feed in camera_feeds.items()}
+
+def get_feed(cam_id):
+    feed = camera_feeds.get(cam_id)
+    if feed is None:
+        abort(404)
+    return feed
+
+def start_camera_source(cam_id, source, pacing=None, loop=None):
+    with camera_lock:
+        load_model_async()
+        cam = cameras.get(cam_id)
+        # A thread still opening its source counts as running, so it isn't replaced and orphaned
+        if cam is not None and cam.is_alive():
+            return {'success': True, 'message': f'Camera {cam_id} is already running'}
+        active = sum(1 for c in cameras.values() if c.is_alive())
+        if active >= MAX_CAMERAS:
+            return {'success': False, 'message': f'At most {MAX_CAMERAS} cameras can run at once'}
+        feed = camera_feeds.setdefault(cam_id, new_camera_feed())
+        cameras[cam_id] = CameraThread(cam_id, source, feed, pacing=pacing, loop=loop)
+        cameras[cam_id].start()
+        return {'success': True, 'message': f'Camera {cam_id} started successfully'}
+
+def stop_camera_source(cam_id):
+    with camera_lock:
+        cam = cameras.pop(cam_id, None)
+        if cam:
+            cam.stop()
+        if cam_id in camera_feeds:
+            for frames in camera_feeds[cam_id]['frames'].values():
+                frames.clear()
+        return {'success': True, 'message': f'Camera {cam_id} stopped'}
+
+@app.route('/cameras')
+def list_cameras():
+    return jsonify({'configured': {k: display_source(v) for k, v in CAMERA_SOURCES.items()}, 'cameras': camera_stats()})
+
+@app.route('/cameras/<cam_id>/start')
+def start_camera_id(cam_id):
+    if not CAMERA_ID_RE.match(cam_id):
+        abort(404)
+    source = request.args.get('source')
+    if source:
+        source = parse_camera_source(source)
+        if not allowed_camera_source(source):
+            return jsonify({'success': False, 'message': 'This source is not allowed'}), 403
+    else:
+        source = CAMERA_SOURCES.get(cam_id)
+    if source is None:
+        return jsonify({'success': False, 'message': f'No source configured for camera {cam_id}'}), 400
+    pacing = request.args.get('pacing')
+    if pacing not in (None, 'realtime', 'fast'):
+        return jsonify({'success': False, 'message': "pacing must be 'realtime' or 'fast'"}), 400
+    loop = request.args.get('loop')
+    return jsonify(start_camera_source(cam_id, source, pacing, None if loop is None else loop != '0'))
+
+@app.route('/cameras/<cam_id>/stop')
+def stop_camera_id(cam_id):
+    return jsonify(stop_camera_source(cam_id))
+
 @app.route('/start_camera')
 def start_camera():
-    global camera_thread
-    with camera_lock:
-        load_model_async('best.pt')
-        if camera_thread is None or not camera_thread.running:
-            stop_event.clear()
-            camera_thread = CameraThread(camera_id=0)
-            camera_thread.start()
-            return jsonify({'success': True, 'message': 'Camera started successfully'})
-        else:
-            return jsonify({'success': True, 'message': 'Camera is already running'})
+    return jsonify(start_camera_source(DEFAULT_CAMERA, CAMERA_SOURCES[DEFAULT_CAMERA]))
 
 @app.route('/stop_camera')
 def stop_camera():
-    global camera_thread
-    with camera_lock:
-        if camera_thread:
-            camera_thread.stop()
-            stop_event.set()
-            camera_thread = None
-        while not frame_queue.empty():
-            try: frame_queue.get_nowait()
-            except queue.Empty: pass
-        return jsonify({'success': True, 'message': 'Camera stopped'})
-
-def generate_mjpeg():
-    while True:
-        try:
-            frame = frame_queue.get(timeout=5)
-        except queue.Empty:
-            yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + b'' + b'\r\n')
-            continue
-        yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+    return jsonify(stop_camera_source(DEFAULT_CAMERA))
+
+def generate_mjpeg(feed, profile, auto=False):
+    # Each viewer tracks the last sequence number it sent and only ever gets the
+    # newest frame; a jump of more than one means it missed frames because its
+    # connection could not keep up
+    names = list(STREAM_PROFILES)
+    level = names.index(profile)
+    frames = feed['frames'][profile]
+    frames.add_viewer(1)
+    try:
+        seq = 0
+        behind = 0.0
+        switched_at = time.monotonic()
+        while True:
+            new_seq, frame = frames.wait(seq, timeout=5)
+            if frame is None:
+                yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + b'' + b'\r\n')
+                continue
+            missed = seq and new_seq - seq > 1
+            seq = new_seq
+            yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            if not auto:
+                continue
+            behind = 0.8 * behind + (0.2 if missed else 0.0)
+            now = time.monotonic()
+            step = 0
+            if behind > 0.5 and level < len(names) - 1:
+                step = 1
+            elif behind < 0.05 and level > 0 and now - switched_at > STREAM_UPGRADE_AFTER:
+                step = -1
+            if step:
+                frames.add_viewer(-1)
+                level += step
+                frames = feed['frames'][names[level]]
+                frames.add_viewer(1)
+                seq, behind, switched_at = 0, 0.0, now
+    finally:
+        frames.add_viewer(-1)
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(generate_mjpeg(), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/cameras/<cam_id>/video_feed')
+def video_feed(cam_id=DEFAULT_CAMERA):
+    feed = get_feed(cam_id)
+    profile = request.args.get('profile', STREAM_DEFAULT_PROFILE)
+    auto = profile == 'auto'
+    if auto:
+        profile = STREAM_DEFAULT_PROFILE
+    elif profile not in STREAM_PROFILES:
+        return jsonify({'success': False, 'message': f"profile must be one of {', '.join(STREAM_PROFILES)} or auto"}), 400
+    return Response(generate_mjpeg(feed, profile, auto), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/snapshot.jpg')
+@app.route('/cameras/<cam_id>/snapshot.jpg')
+def snapshot_jpg(cam_id=DEFAULT_CAMERA):
+    _, frame = get_feed(cam_id)['frames'][STREAM_DEFAULT_PROFILE].latest()
+    if frame is None:
+        return jsonify({'success': False, 'message': 'No camera frame available'}), 503
+    response = Response(frame, mimetype='image/jpeg')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @app.route('/detections')
-def get_detections():
-    return jsonify({
+@app.route('/cameras/<cam_id>/detections')
+def get_detections(cam_id=DEFAULT_CAMERA):
+    detections = get_feed(cam_id)['latest']
+    fmt, binary = response_options()
+    error = options_error(fmt, binary)
+    if error:
+        return error
+    payload = {
         'detections': detections,
         'count': len(detections),
         'timestamp': datetime.now().isoformat()
-    })
+    }
+    return api_response(shape_detections(payload, detections, model_obj['classes'], fmt), binary)
+
+# Decoding and tiling live in ingest.py and tiling.py, shared with score.py so
+# offline scores match /upload
+def decode_upload(data):
+    # Returns (image, scale): scale maps decoded pixels to the full upright image
+    return decode_image(data, DECODE_TARGET_SIZE if REDUCED_DECODE else None,
+                        full_above=TILE_THRESHOLD if TILED_INFERENCE else None)
+
+def infer_upload(image):
+    # Returns (Detections, number of tiles); tiles are submitted together so
+    # the scheduler runs them in full batches
+    crops, offsets = tile_inputs(image, TILE_THRESHOLD if TILED_INFERENCE else None, TILE_SIZE, TILE_OVERLAP)
+    futures = [scheduler.submit(crop, conf=UPLOAD_CONF) for crop in crops]
+    results = [future.result() for future in futures]
+    return merge_tiles(results, offsets, TILE_MERGE_THRESHOLD), len(crops) - 1
+
+def record_upload_timing(tiles, inference_ms):
+    with timing_lock:
+        timing = upload_timing['tiled' if tiles else 'standard']
+        timing['count'] += 1
+        timing['total_ms'] += inference_ms
+        if tiles:
+            timing['tiles'] += tiles
+
+def upload_timing_snapshot():
+    with timing_lock:
+        return {mode: dict(t, avg_ms=round(t['total_ms'] / t['count'], 1) if t['count'] else None)
+                for mode, t in upload_timing.items()}
+
+def response_options():
+    # (format, msgpack?) from ?format=full|compact|packed and ?encoding=msgpack or the Accept header
+    fmt = request.values.get('format', 'full')
+    binary = request.values.get('encoding') == 'msgpack' or MSGPACK_MIMETYPE in request.headers.get('Accept', '')
+    return fmt, binary
+
+def options_error(fmt, binary):
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'message': f"format must be one of {', '.join(FORMATS)}"}), 400
+    if binary and msgpack is None:
+        return jsonify({'success': False, 'message': 'MessagePack is not available on this server'}), 406
+    return None
+
+def api_response(payload, binary):
+    if binary:
+        return Response(packb(payload), mimetype=MSGPACK_MIMETYPE)
+    return jsonify(payload)
+
+def format_upload_result(result, fmt):
+    records = result.get('detections')
+    if records is None:
+        return result
+    table = model_obj['classes']
+    if fmt == 'full':
+        result['detections'] = [dict(table.upload[d['class_id']], confidence=d['confidence']) for d in records]
+        return result
+    return shape_detections(result, records, table, fmt)
+
+def process_upload(filename, data, annotate=True):
+    ext = image_ext(filename)
+    digest = content_digest(data)
+    input_image = None
+    if SAVE_ORIGINALS:
+        input_key = UploadStore.key_for(digest, ext)
+        # Registered like the annotated output, so a GET that comes in before
+        # the write finishes waits for it instead of getting a 404
+        schedule_output(input_key, store_file, input_key, data)
+        input_image = f"/{UPLOAD_FOLDER}/{input_key}"
+
+    if not model_obj['loaded'] or not model_obj['model']:
+        return {'success': False, 'message': 'YOLO model not loaded yet. Please wait.'}
+
+    output_key = UploadStore.key_for(digest, ext, annotated_variant())
+    output_image = f"/{UPLOAD_FOLDER}/{output_key}" if annotate else None
+    # On disk, or being rendered and waited for by a GET
+    rendered = output_pending(output_key) or upload_store.exists(output_key)
+    cache_key = ResultCache.key(digest, upload_version(), UPLOAD_CONF)
+    cached = result_cache.get(cache_key)
+    if cached is not None and (not annotate or rendered or cached['annotated'] is not None):
+        if annotate and not rendered:
+            schedule_output(output_key, store_file, output_key, cached['annotated'])
+        return {
+            'success': True,
+            'cached': True,
+            'filename': filename,
+            'detections': cached['detections'],
+            'input_image': input_image,
+            'output_image': output_image
+        }
+
+    try:
+        image, scale = decode_upload(data)
+        if image is None:
+            return {'success': False, 'message': 'Could not read uploaded image'}
+        start = time.perf_counter()
+        det, tiles = infer_upload(image)
+        inference_ms = (time.perf_counter() - start) * 1000
+        record_upload_timing(tiles, inference_ms)
+        names = model_obj['model'].names
+
+        # Boxes in the full-size upright image; the annotated image is drawn
+        # at decoded size with the boxes as detected. Results are kept as
+        # class-id records and turned into the requested format per response.
+        full_det = Detections(det.boxes * np.array(scale * 2, np.float32), det.scores, det.class_ids)
+        local_detections = detection_records(full_det, model_obj['classes'].ids)
+
+        # Cached now so an identical upload right after is a hit; the
+        # annotated bytes are attached once rendering finishes
+        result_cache.put(cache_key, local_detections, None)
+        if annotate and not rendered:
+            schedule_output(output_key, render_annotated, image, det, names, ext, output_key, cache_key)
+
+        return {
+            'success': True,
+            'cached': False,
+            'filename': filename,
+            'tiles': tiles,
+            'inference_ms': round(inference_ms, 1),
+            'detections': local_detections,
+            'input_image': input_image,
+            'output_image': output_image
+        }
+    except Exception as e:
+        return {'success': False, 'message': f'Detection failed: {str(e)}'}
+
+def generate_detection_events(detections_feed):
+    detections_feed.add_viewer(1)
+    try:
+        sent_classes = set()
+        sent_table = None
+        seq = 0
+        yield 'retry: 2000\n\n'
+        while True:
+            seq, value = detections_feed.wait(seq, timeout=15)
+            if value is None:
+                yield ': keep-alive\n\n'
+                continue
+            data, classes = value
+            table = model_obj['classes']
+            if table is not sent_table:
+                # Model or knowledge base reloaded: resend class text as needed
+                sent_classes, sent_table = set(), table
+            new = [cls for cls in classes if cls not in sent_classes]
+            if new and table is not None:
+                sent_classes.update(new)
+                # Pre-serialized per-class fragments, joined into one JSON object
+                body = ', '.join(f'"{cls}": {table.fragments[cls]}' for cls in new)
+                yield f"event: classes\ndata: {{{body}}}\n\n"
+            yield f"event: detections\ndata: {data}\n\n"
+    finally:
+        detections_feed.add_viewer(-1)
+
+@app.route('/detections/stream')
+@app.route('/cameras/<cam_id>/detections/stream')
+def detections_stream(cam_id=DEFAULT_CAMERA):
+    feed = get_feed(cam_id)
+    response = Response(generate_detection_events(feed['detections']), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/upload', methods=['POST'])
 def upload_image():
@@ -948,52 +1646,136 @@ def upload_image():
         return jsonify({'success': False, 'message': 'No file selected'})
     
     filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    fmt, binary = response_options()
+    error = options_error(fmt, binary)
+    if error:
+        return error
+    # API clients that draw their own boxes can skip the annotated image with annotate=0
+    annotate = request.values.get('annotate', '1') != '0'
+    return api_response(format_upload_result(process_upload(filename, file.read(), annotate), fmt), binary)
+
+def iter_batch_files(uploads):
+    # Yields (filename, bytes, None) for plain image files and the images inside
+    # zip archives, or (filename, None, message) for ones that won't be processed;
+    # images past BATCH_MAX_FILES each get an error line instead of vanishing.
+    # uploads are (filename, stream) pairs, read one file at a time as the window needs them
+    count = 0
+    over_limit = f'Batch is limited to {BATCH_MAX_FILES} images'
+    max_size = app.config['MAX_CONTENT_LENGTH']
+    for filename, stream in uploads:
+        if not filename.lower().endswith('.zip'):
+            count += 1
+            if count > BATCH_MAX_FILES:
+                yield filename, None, over_limit
+                continue
+            data = stream.read(max_size + 1)
+            yield filename, data if len(data) <= max_size else None, None
+            continue
+        try:
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile:
+            yield filename, None, None
+            continue
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or name.startswith('.') or info.filename.startswith('__MACOSX'):
+                continue
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTS:
+                continue
+            count += 1
+            if count > BATCH_MAX_FILES:
+                yield secure_filename(name), None, over_limit
+                continue
+            if info.file_size > max_size:
+                yield secure_filename(name), None, None
+                continue
+            yield secure_filename(name), archive.read(info), None
 
+def process_batch_item(index, filename, data, message, annotate):
+    if data is None:
+        result = {'success': False, 'message': message or 'Unreadable or oversized file'}
+    else:
+        result = process_upload(filename, data, annotate)
+    result['index'] = index
+    result.setdefault('filename', filename)
+    return result
+
+@app.route('/upload_batch', methods=['POST'])
+def upload_batch():
+    # Must be set before the body is parsed: batches get their own limit and
+    # are spooled to temp files rather than held in memory
+    request.max_content_length = BATCH_MAX_CONTENT_LENGTH
+    request.spool_files = True
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not files:
+        return jsonify({'success': False, 'message': 'No files uploaded'})
     if not model_obj['loaded'] or not model_obj['model']:
         return jsonify({'success': False, 'message': 'YOLO model not loaded yet. Please wait.'})
+    fmt, binary = response_options()
+    error = options_error(fmt, binary)
+    if error:
+        return error
+    annotate = request.values.get('annotate', '1') != '0'
+    # Take the spooled files over from the request, which closes its files as
+    # soon as this view returns, before the response below is streamed
+    uploads = []
+    for f in files:
+        if f.filename:
+            uploads.append((secure_filename(f.filename), f.stream))
+            f.stream = io.BytesIO()
+    # NDJSON lines, or back-to-back MessagePack objects
+    encode = packb if binary else (lambda obj: dumps(obj) + b'\n')
 
-    try:
-        results = model_obj['model'](filepath, conf=0.5, verbose=False)
-        annotated = results[0].plot()
-        output_filename = f"annotated_{filename}"
-        output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-        cv2.imwrite(output_path, annotated)
+    def generate():
+        # Keep a bounded window in flight: workers decode in parallel while the
+        # scheduler batches their inference calls; lines go out as each finishes
+        start = time.perf_counter()
+        pending = set()
+        # Zip members are extracted lazily so only the in-flight window is decompressed
+        items_iter = enumerate(iter_batch_files(uploads))
+        done = 0
+        while True:
+            while len(pending) < BATCH_WINDOW:
+                try:
+                    index, (filename, data, message) = next(items_iter)
+                except StopIteration:
+                    break
+                pending.add(batch_pool.submit(process_batch_item, index, filename, data, message, annotate))
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done += 1
+                yield encode(format_upload_result(future.result(), fmt))
+        elapsed = time.perf_counter() - start
+        yield encode({'done': True, 'count': done, 'seconds': round(elapsed, 3),
+                      'images_per_sec': round(done / elapsed, 2) if elapsed else None})
 
-        local_detections = []
-        boxes = results[0].boxes
-        if boxes is not None:
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                conf_val = float(box.conf[0])
-                cls = int(box.cls[0])
-                name = model_obj['model'].names.get(cls, str(cls))
-                
-                info = disease_info.get(name.replace(" ", "_"), {
-                    'diagnosis': 'Info not available',
-                    'remedy': 'Info not available'
-                })
-                
-                local_detections.append({
-                    'class': name,
-                    'confidence': conf_val,
-                    'Diagnosis': info['diagnosis'],
-                    'Remedy': info['remedy']
-                })
-
-        return jsonify({
-            'success': True,
-            'detections': local_detections,
-            'input_image': f"/{UPLOAD_FOLDER}/{filename}",
-            'output_image': f"/{UPLOAD_FOLDER}/{output_filename}"
-        })
-    except Exception as e:
-        return jsonify({'success': False, 'message': f'Detection failed: {str(e)}'})
+    def close_uploads():
+        for _, stream in uploads:
+            stream.close()
+
+    response = Response(generate(), mimetype=MSGPACK_MIMETYPE if binary else 'application/x-ndjson')
+    response.call_on_close(close_uploads)
+    return response
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     from flask import send_from_directory
+    with pending_lock:
+        future = pending_outputs.get(filename)
+    if future is not None:
+        try:
+            future.result(timeout=RENDER_WAIT_TIMEOUT)
+        except Exception as e:
+            print(f"Rendering {filename} failed: {e}")
+    if UploadStore.valid_key(filename):
+        path = upload_store.get_path(filename)
+        if path is None:
+            abort(404)
+        # Content-addressed files never change, so clients can cache them for good
+        return send_file(path, max_age=31536000)
+    # Files saved before the content-addressed store existed
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 if __name__ == "__main__":
@@ -1002,4 +1784,4 @@ if __name__ == "__main__":
     print("URL: http://127.0.0.1:8000")
     print("Make sure 'best.pt' is in the same directory!")
     print("="*50)
-    app.run(host="0.0.0.0", port=8000, debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=8000, debug=True, use_reloader=USE_RELOADER)
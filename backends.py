@@ -0,0 +1,366 @@
+import ast
+import os
+import zipfile
+
+import cv2
+import numpy as np
+
+
+# Detections for one image: xyxy boxes in original image pixels, scores and class ids
+class Detections:
+    __slots__ = ('boxes', 'scores', 'class_ids')
+
+    def __init__(self, boxes=None, scores=None, class_ids=None):
+        self.boxes = np.zeros((0, 4), np.float32) if boxes is None else boxes
+        self.scores = np.zeros((0,), np.float32) if scores is None else scores
+        self.class_ids = np.zeros((0,), np.int64) if class_ids is None else class_ids
+
+    def __len__(self):
+        return len(self.scores)
+
+    @classmethod
+    def from_ultralytics(cls, result):
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return cls()
+        # One device-to-host copy for the whole (N, 6) tensor
+        data = boxes.data.cpu().numpy()
+        return cls(data[:, :4].astype(np.float32), data[:, 4].astype(np.float32), data[:, 5].astype(np.int64))
+
+
+def letterbox(image, size=640, pad_value=114):
+    h, w = image.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    if (nh, nw) != (h, w):
+        image = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas = np.full((size, size, 3), pad_value, dtype=np.uint8)
+    canvas[top:top + nh, left:left + nw] = image
+    return canvas, r, (left, top)
+
+
+def preprocess(images, size=640, layout='nchw'):
+    canvases, metas = [], []
+    for image in images:
+        canvas, r, pad = letterbox(image, size)
+        canvases.append(canvas)
+        metas.append((r, pad, image.shape[:2]))
+    # BGR HWC uint8 -> RGB NCHW (or NHWC for TensorFlow) float32 in [0, 1]
+    batch = np.stack(canvases)[..., ::-1]
+    if layout == 'nchw':
+        batch = batch.transpose(0, 3, 1, 2)
+    batch = np.ascontiguousarray(batch, dtype=np.float32)
+    batch *= 1.0 / 255.0
+    return batch, metas
+
+
+def box_iou(a, b):
+    # Pairwise IoU between (N, 4) and (M, 4) xyxy boxes -> (N, M)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = (rb - lt).clip(0).prod(2)
+    area_a = (a[:, 2:] - a[:, :2]).clip(0).prod(1)
+    area_b = (b[:, 2:] - b[:, :2]).clip(0).prod(1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def nms(boxes, scores, iou_thres=0.7):
+    if len(boxes) == 0:
+        return np.zeros((0,), np.int64)
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        h = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, class_ids, iou_thres=0.7, max_wh=7680):
+    # Offset boxes per class so one NMS pass never suppresses across classes
+    offsets = class_ids[:, None].astype(boxes.dtype) * max_wh
+    return nms(boxes + offsets, scores, iou_thres)
+
+
+def decode_yolo(pred, conf=0.25, iou=0.7, max_det=300):
+    # pred: (4 + nc, anchors) raw YOLOv8/11 head output without NMS
+    pred = pred.T
+    class_scores = pred[:, 4:]
+    class_ids = class_scores.argmax(1)
+    scores = class_scores[np.arange(len(pred)), class_ids]
+    mask = scores > conf
+    if not mask.any():
+        return Detections()
+    xywh, scores, class_ids = pred[mask, :4], scores[mask], class_ids[mask]
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    keep = batched_nms(boxes, scores, class_ids, iou)[:max_det]
+    return Detections(boxes[keep].astype(np.float32), scores[keep].astype(np.float32), class_ids[keep].astype(np.int64))
+
+
+def scale_boxes(det, meta):
+    r, (left, top), (h, w) = meta
+    if len(det):
+        det.boxes -= np.array([left, top, left, top], dtype=np.float32)
+        det.boxes /= r
+        det.boxes[:, [0, 2]] = det.boxes[:, [0, 2]].clip(0, w)
+        det.boxes[:, [1, 3]] = det.boxes[:, [1, 3]].clip(0, h)
+    return det
+
+
+def parse_names(value):
+    if isinstance(value, dict):
+        return {int(k): v for k, v in value.items()}
+    return {int(k): v for k, v in ast.literal_eval(value).items()}
+
+
+def read_metadata_yaml(directory):
+    # Ultralytics writes metadata.yaml (names, imgsz, ...) next to TF exports
+    path = os.path.join(directory, 'metadata.yaml')
+    if not os.path.exists(path):
+        return {}
+    import yaml
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
+
+
+# Common interface: .names maps class id -> name, .predict(images, conf) -> [Detections]
+class Backend:
+    kind = 'base'
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.names = {}
+
+    def predict(self, images, conf=0.5):
+        raise NotImplementedError
+
+
+class UltralyticsBackend(Backend):
+    kind = 'ultralytics'
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.names = dict(self.model.names)
+
+    def predict(self, images, conf=0.5):
+        results = self.model(images, conf=conf, verbose=False, batch=len(images))
+        return [Detections.from_ultralytics(r) for r in results]
+
+
+def export_onnx(weights, imgsz=640):
+    # Export once and reuse the .onnx next to the weights afterwards
+    onnx_path = os.path.splitext(weights)[0] + '.onnx'
+    if os.path.exists(onnx_path) and os.path.getmtime(onnx_path) >= os.path.getmtime(weights):
+        return onnx_path
+    from ultralytics import YOLO
+    print(f"Exporting {weights} to ONNX...")
+    return YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+
+
+# Backends that return the raw (B, 4 + nc, anchors) head output and decode on the host
+class RawYoloBackend(Backend):
+    layout = 'nchw'
+
+    def __init__(self, model_path, imgsz=640, iou=0.7):
+        super().__init__(model_path)
+        self.imgsz = imgsz
+        self.iou = iou
+
+    def _run(self, batch):
+        raise NotImplementedError
+
+    def predict(self, images, conf=0.5):
+        batch, metas = preprocess(images, self.imgsz, self.layout)
+        preds = self._run(batch)
+        # TF/TFLite exports emit xywh normalized to [0, 1]; anchors always span
+        # the whole input, so a tiny maximum means the boxes need rescaling
+        if preds[:, :4].max() <= 2.0:
+            preds = preds.copy()
+            preds[:, :4] *= self.imgsz
+        return [scale_boxes(decode_yolo(pred, conf, self.iou), meta) for pred, meta in zip(preds, metas)]
+
+
+def run_fixed_batch(run, batch, step):
+    # Static exports only take the batch size they were exported with
+    outputs = []
+    for i in range(0, len(batch), step):
+        chunk = batch[i:i + step]
+        n = len(chunk)
+        if n < step:
+            pad = np.zeros((step - n,) + chunk.shape[1:], dtype=chunk.dtype)
+            chunk = np.concatenate([chunk, pad])
+        outputs.append(run(chunk)[:n])
+    return np.concatenate(outputs)
+
+
+class OnnxBackend(RawYoloBackend):
+    kind = 'onnx'
+
+    def __init__(self, model_path, imgsz=640, iou=0.7, threads=None):
+        if model_path.endswith('.pt'):
+            model_path = export_onnx(model_path, imgsz)
+        super().__init__(model_path, imgsz, iou)
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The 'onnx' backend needs onnxruntime (pip install onnxruntime)") from e
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, opts, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        shape = self.session.get_inputs()[0].shape
+        self.fixed_batch = shape[0] if isinstance(shape[0], int) else None
+        if isinstance(shape[2], int):
+            self.imgsz = shape[2]
+
+        meta = self.session.get_modelmeta().custom_metadata_map
+        if 'names' in meta:
+            self.names = parse_names(meta['names'])
+
+    def _session_run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+    def _run(self, batch):
+        if self.fixed_batch is None:
+            return self._session_run(batch)
+        return run_fixed_batch(self._session_run, batch, self.fixed_batch)
+
+
+def int8_paths(model_path):
+    stem = os.path.splitext(model_path)[0]
+    if stem.endswith('.int8'):
+        stem = stem[:-5]
+    return stem + '.int8.onnx', stem + '.int8.json'
+
+
+# Serves the INT8 model written by quantize.py, but only if its report passed the gate
+class QuantizedOnnxBackend(OnnxBackend):
+    kind = 'onnx_int8'
+
+    def __init__(self, model_path, imgsz=640, iou=0.7, threads=None):
+        quant_path, report_path = int8_paths(model_path)
+        if not os.path.exists(quant_path):
+            raise FileNotFoundError(f"{quant_path} not found, run: python quantize.py {model_path}")
+        import json
+        report = {}
+        if os.path.exists(report_path):
+            with open(report_path) as f:
+                report = json.load(f)
+        if not report.get('passed'):
+            raise RuntimeError(f"{quant_path} has no passing accuracy report ({report_path}), re-run quantize.py")
+        super().__init__(quant_path, imgsz, iou, threads)
+        self.report = report
+
+
+class SavedModelBackend(RawYoloBackend):
+    kind = 'saved_model'
+    layout = 'nhwc'
+
+    def __init__(self, model_path, imgsz=640, iou=0.7):
+        super().__init__(model_path, imgsz, iou)
+        try:
+            import tensorflow as tf
+        except ImportError as e:
+            raise ImportError("The 'saved_model' backend needs tensorflow (pip install tensorflow-cpu)") from e
+
+        self.tf = tf
+        meta = read_metadata_yaml(model_path)
+        if 'names' in meta:
+            self.names = parse_names(meta['names'])
+        if 'imgsz' in meta:
+            self.imgsz = int(meta['imgsz'][0])
+        model = tf.saved_model.load(model_path)
+        self.fn = model.signatures['serving_default']
+        spec = list(self.fn.structured_input_signature[1].values())[0]
+        self.fixed_batch = spec.shape[0]
+
+    def _call(self, batch):
+        out = self.fn(self.tf.constant(batch))
+        return next(iter(out.values())).numpy()
+
+    def _run(self, batch):
+        if self.fixed_batch is None:
+            return self._call(batch)
+        return run_fixed_batch(self._call, batch, self.fixed_batch)
+
+
+def read_tflite_metadata(model_path):
+    # Ultralytics appends a zip holding the metadata dict to .tflite files
+    try:
+        with zipfile.ZipFile(model_path, 'r') as zf:
+            return ast.literal_eval(zf.read(zf.namelist()[0]).decode('utf-8'))
+    except (zipfile.BadZipFile, IndexError, ValueError, SyntaxError):
+        return {}
+
+
+class TFLiteBackend(RawYoloBackend):
+    kind = 'tflite'
+    layout = 'nhwc'
+
+    def __init__(self, model_path, imgsz=640, iou=0.7, threads=None):
+        super().__init__(model_path, imgsz, iou)
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                import tensorflow as tf
+            except ImportError as e:
+                raise ImportError("The 'tflite' backend needs tflite-runtime or tensorflow") from e
+            Interpreter = tf.lite.Interpreter
+
+        meta = read_tflite_metadata(model_path) or read_metadata_yaml(os.path.dirname(model_path))
+        if 'names' in meta:
+            self.names = parse_names(meta['names'])
+        self.interpreter = Interpreter(model_path=model_path, num_threads=threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.fixed_batch = int(self.input['shape'][0])
+        self.imgsz = int(self.input['shape'][1])
+
+    def _invoke(self, batch):
+        inp, out = self.input, self.output
+        if inp['dtype'] in (np.int8, np.uint8):
+            scale, zero_point = inp['quantization']
+            batch = (batch / scale + zero_point).round().clip(
+                np.iinfo(inp['dtype']).min, np.iinfo(inp['dtype']).max).astype(inp['dtype'])
+        self.interpreter.set_tensor(inp['index'], batch)
+        self.interpreter.invoke()
+        y = self.interpreter.get_tensor(out['index'])
+        if out['dtype'] in (np.int8, np.uint8):
+            scale, zero_point = out['quantization']
+            y = (y.astype(np.float32) - zero_point) * scale
+        return y
+
+    def _run(self, batch):
+        return run_fixed_batch(self._invoke, batch, self.fixed_batch)
+
+
+BACKENDS = {
+    UltralyticsBackend.kind: UltralyticsBackend,
+    OnnxBackend.kind: OnnxBackend,
+    QuantizedOnnxBackend.kind: QuantizedOnnxBackend,
+    SavedModelBackend.kind: SavedModelBackend,
+    TFLiteBackend.kind: TFLiteBackend,
+}
+
+
+def load_backend(kind, model_path, **kwargs):
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{kind}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[kind](model_path, **kwargs)
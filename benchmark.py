@@ -0,0 +1,73 @@
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from backends import load_backend
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def is_annotated(name):
+    # Rendered outputs in an uploads folder: <digest>-annotated-<v>.<ext>, or annotated_<name> from older versions
+    return '-annotated-' in name or name.startswith('annotated_')
+
+
+def load_images(folder, limit=None):
+    # Walks subfolders too, so uploads/ (sharded as uploads/<xx>/) can be used
+    # directly; annotated copies are skipped since they have boxes drawn in
+    paths = sorted(os.path.join(dirpath, name)
+                   for dirpath, _, filenames in os.walk(folder)
+                   for name in filenames
+                   if name.lower().endswith(IMAGE_EXTS) and not is_annotated(name))
+    images = []
+    for path in paths[:limit]:
+        image = cv2.imread(path)
+        if image is not None:
+            images.append(image)
+    return images
+
+
+def time_backend(backend, images, conf=0.5, batch=1, warmup=3):
+    for _ in range(warmup):
+        backend.predict(images[:batch], conf)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(images), batch):
+        t0 = time.perf_counter()
+        backend.predict(images[i:i + batch], conf)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    total = time.perf_counter() - start
+    latencies = np.asarray(latencies)
+    return {
+        'images_per_sec': len(images) / total,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference backends on a folder of images")
+    parser.add_argument('--backend', action='append', required=True,
+                        help="kind:path, e.g. ultralytics:best.pt or saved_model:runs/detect/train/weights/best_saved_model")
+    parser.add_argument('--images', default='uploads')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--conf', type=float, default=0.5)
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.limit)
+    if not images:
+        parser.error(f"No images found in {args.images}")
+    print(f"{len(images)} images, batch {args.batch}")
+    for spec in args.backend:
+        kind, path = spec.split(':', 1)
+        backend = load_backend(kind, path)
+        stats = time_backend(backend, images, args.conf, args.batch)
+        print(f"{kind:12s} {stats['images_per_sec']:8.1f} img/s  p50 {stats['p50_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
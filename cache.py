@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+# LRU cache of upload results keyed by content hash, model version and threshold
+class ResultCache:
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, max_age=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    @staticmethod
+    def key(digest, model_version, conf):
+        # digest is the content hash of the uploaded bytes (storage.content_digest)
+        return f"{digest}:{model_version}:{conf}"
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            if self.max_age and time.monotonic() - entry['created'] > self.max_age:
+                self._remove(key)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+
+    def put(self, key, detections, annotated):
+        # annotated may be None when the client skipped rendering or it is still
+        # being rendered (see attach)
+        size = len(annotated or b'') + len(json.dumps(detections))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = {
+                'detections': detections,
+                'annotated': annotated,
+                'size': size,
+                'created': time.monotonic()
+            }
+            self.total_bytes += size
+            self._shrink()
+
+    def attach(self, key, annotated):
+        # Add the rendered image to an entry that was put without one
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry['annotated'] is not None:
+                return
+            if entry['size'] + len(annotated) > self.max_bytes:
+                return
+            entry['annotated'] = annotated
+            entry['size'] += len(annotated)
+            self.total_bytes += len(annotated)
+            self._shrink()
+
+    def snapshot(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, entries=len(self.entries), bytes=self.total_bytes,
+                        hit_rate=self.stats['hits'] / lookups if lookups else 0.0)
+
+    def _shrink(self):
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.stats['evictions'] += 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry['size']
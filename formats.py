@@ -0,0 +1,76 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+# Optional speed-ups: orjson for JSON, msgpack for binary bodies
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+# 'full': every detection carries its class name and text (the original layout)
+# 'compact': detections hold class_id/confidence/bbox, class text sent once in 'classes'
+# 'packed': like compact, with detections as parallel arrays and a flat bbox list
+FORMATS = ('full', 'compact', 'packed')
+
+
+def dumps(obj):
+    # JSON bytes, via orjson when it is installed
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def packb(obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+# Flask's jsonify through orjson when it is installed, with the same key
+# sorting and debug indentation as the default provider
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+
+def class_side_table(records, table):
+    # Class text for the classes present, once each, keyed by class id as a
+    # string so JSON and MessagePack bodies match (msgpack clients reject int
+    # map keys by default)
+    return {str(cls): table.info[cls] for cls in sorted({d['class_id'] for d in records})}
+
+
+def compact_detections(records, digits=3):
+    return [{'class_id': d['class_id'], 'confidence': round(d['confidence'], digits), 'bbox': d['bbox']}
+            for d in records]
+
+
+def packed_detections(records, digits=3):
+    return {
+        'class_id': [d['class_id'] for d in records],
+        'confidence': [round(d['confidence'], digits) for d in records],
+        'bbox': [v for d in records for v in d['bbox']]
+    }
+
+
+def shape_detections(payload, records, table, fmt):
+    # Fill payload['detections'] (and 'classes') from class-id records in the
+    # requested format; 'full' is left to the caller since its layout differs per endpoint
+    if fmt == 'compact':
+        payload['classes'] = class_side_table(records, table)
+        payload['detections'] = compact_detections(records)
+    elif fmt == 'packed':
+        payload['classes'] = class_side_table(records, table)
+        payload['detections'] = packed_detections(records)
+    return payload
@@ -0,0 +1,85 @@
+import threading
+import queue
+import time
+from concurrent.futures import Future
+
+
+# Micro-batching scheduler: requests are queued, collected for a few
+# milliseconds and run through the model as one batched call.
+class InferenceScheduler(threading.Thread):
+    def __init__(self, predict_fn, max_batch=8, max_wait_ms=10):
+        super().__init__(daemon=True)
+        # predict_fn(images, conf) -> list of results, one per image
+        self.predict_fn = predict_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.requests = queue.Queue()
+        self.stats_lock = threading.Lock()
+        self.stats = {'batches': 0, 'images': 0, 'errors': 0, 'max_batch_seen': 0}
+
+    def submit(self, image, conf=0.5):
+        future = Future()
+        self.requests.put((image, conf, future))
+        return future
+
+    def snapshot(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats['avg_batch'] = stats['images'] / stats['batches'] if stats['batches'] else 0.0
+        stats['pending'] = self.requests.qsize()
+        return stats
+
+    def _collect(self):
+        try:
+            first = self.requests.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Still drain anything that is already waiting
+                    batch.append(self.requests.get_nowait())
+                else:
+                    batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batch(self, batch):
+        # Requests with different thresholds can't share one call
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[1], []).append(item)
+
+        for conf, items in groups.items():
+            # Drop requests whose callers already gave up
+            items = [it for it in items if it[2].set_running_or_notify_cancel()]
+            if not items:
+                continue
+            try:
+                results = self.predict_fn([img for img, _, _ in items], conf)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Expected {len(items)} results, got {len(results)}")
+            except Exception as e:
+                with self.stats_lock:
+                    self.stats['errors'] += 1
+                for _, _, future in items:
+                    future.set_exception(e)
+                continue
+
+            with self.stats_lock:
+                self.stats['batches'] += 1
+                self.stats['images'] += len(items)
+                self.stats['max_batch_seen'] = max(self.stats['max_batch_seen'], len(items))
+            for (_, _, future), result in zip(items, results):
+                future.set_result(result)
+
+    def run(self):
+        # Runs for the life of the process (daemon thread)
+        while True:
+            batch = self._collect()
+            if batch:
+                self._run_batch(batch)
@@ -0,0 +1,111 @@
+import struct
+
+import cv2
+import numpy as np
+
+REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) share the range but don't
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _exif_orientation(segment):
+    # segment: APP1 payload starting with b'Exif\0\0'
+    tiff = segment[6:]
+    if len(tiff) < 8 or tiff[:2] not in (b'II', b'MM'):
+        return 1
+    endian = '<' if tiff[:2] == b'II' else '>'
+    ifd = struct.unpack(endian + 'I', tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return 1
+    count = struct.unpack(endian + 'H', tiff[ifd:ifd + 2])[0]
+    for i in range(count):
+        entry = ifd + 2 + 12 * i
+        if entry + 12 > len(tiff):
+            break
+        tag, _, _, value = struct.unpack(endian + 'HHIH', tiff[entry:entry + 10])
+        if tag == 0x0112:
+            return value if 1 <= value <= 8 else 1
+    return 1
+
+
+def jpeg_info(data):
+    # (width, height, exif orientation) from the JPEG header without decoding,
+    # or None if data is not a readable JPEG
+    if data[:2] != b'\xff\xd8':
+        return None
+    orientation = 1
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        segment = data[pos + 4:pos + 2 + length]
+        if marker == 0xE1 and segment[:6] == b'Exif\x00\x00':
+            orientation = _exif_orientation(segment)
+        elif marker in SOF_MARKERS and len(segment) >= 5:
+            height, width = struct.unpack('>HH', segment[1:5])
+            return width, height, orientation
+        elif marker == 0xDA:
+            return None
+        pos += 2 + length
+    return None
+
+
+def apply_orientation(image, orientation):
+    # Turn an image upright according to its EXIF orientation (1-8)
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(image), -1)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+def reduction_factor(width, height, target):
+    # Largest JPEG DCT scale (1/8, 1/4, 1/2) that keeps the longest side >= target
+    for factor in (8, 4, 2):
+        if max(width, height) / factor >= target:
+            return factor
+    return 1
+
+
+# Decode upload bytes upright, at reduced size when target is given and the
+# image is a JPEG at least twice that size. JPEGs whose longest side is above
+# full_above (the ones that will be tiled) are always decoded at full size.
+# Returns (image, scale) where scale (sx, sy) maps decoded pixel coordinates
+# back to the full-size upright image; image is None if data can't be decoded.
+def decode_image(data, target=None, full_above=None):
+    buf = np.frombuffer(data, np.uint8)
+    info = jpeg_info(data)
+    if info is None:
+        # Not a JPEG (or an unusual one): plain decode, OpenCV handles orientation
+        image = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        return image, (1.0, 1.0)
+    width, height, orientation = info
+    if full_above is not None and max(width, height) > full_above:
+        target = None
+    factor = reduction_factor(width, height, target) if target else 1
+    image = cv2.imdecode(buf, REDUCED_FLAGS[factor] | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        return None, None
+    image = apply_orientation(image, orientation)
+    if orientation >= 5:
+        width, height = height, width
+    return image, (width / image.shape[1], height / image.shape[0])
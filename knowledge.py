@@ -0,0 +1,71 @@
+import json
+import os
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'disease_info.json')
+
+UNKNOWN_INFO = {
+    'diagnosis': 'Info not available',
+    'remedy': 'Info not available'
+}
+
+
+def normalize(name):
+    # "Tomato_Late_Blight", "tomato late  blight" and "Tomato Late Blight" are the same class
+    return ' '.join(name.replace('_', ' ').split()).casefold()
+
+
+def parse_entries(data):
+    if not isinstance(data, dict):
+        raise ValueError("expected an object of class name -> {diagnosis, remedy}")
+    entries = {}
+    for name, entry in data.items():
+        if not isinstance(entry, dict) or not all(isinstance(entry.get(k), str) for k in UNKNOWN_INFO):
+            raise ValueError(f"entry {name!r} needs string 'diagnosis' and 'remedy' fields")
+        entries[normalize(name)] = {'name': name, 'diagnosis': entry['diagnosis'], 'remedy': entry['remedy']}
+    return entries
+
+
+# Diagnosis and remedy text per disease, read from disease_info.json (keyed by
+# the model's class names). The file is parsed once; changed() lets a caller
+# poll for edits and load() again, keeping the last good copy if the new one
+# doesn't parse.
+class KnowledgeBase:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.entries = {}
+        self.mtime = None
+        self.error = None
+        self.loads = 0
+
+    def load(self):
+        try:
+            # Remember the version even if it is broken, so it is reported once
+            self.mtime = os.path.getmtime(self.path)
+            with open(self.path, encoding='utf-8') as f:
+                entries = parse_entries(json.load(f))
+        except (OSError, ValueError) as e:
+            self.error = str(e)
+            print(f"Could not load {self.path}: {e}")
+            return False
+        self.entries, self.error = entries, None
+        self.loads += 1
+        return True
+
+    def changed(self):
+        try:
+            return os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return False
+
+    def lookup(self, name):
+        return self.entries.get(normalize(name), UNKNOWN_INFO)
+
+    def validate(self, names):
+        # (class names without an entry, entries matching no class)
+        wanted = {normalize(name) for name in names.values()}
+        missing = sorted(name for name in names.values() if normalize(name) not in self.entries)
+        unused = sorted(entry['name'] for key, entry in self.entries.items() if key not in wanted)
+        return missing, unused
+
+    def snapshot(self):
+        return {'path': self.path, 'entries': len(self.entries), 'loads': self.loads, 'error': self.error}
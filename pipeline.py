@@ -0,0 +1,94 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+# Single-value hand-off between pipeline stages. Writers overwrite, readers
+# always get the newest value, so a slow stage skips stale frames instead of
+# queueing them. Each value carries a sequence number so readers can wait for
+# something newer than what they already have.
+class LatestSlot:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.value = None
+        self.seq = 0
+        self.read_seq = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, value):
+        with self.cond:
+            if self.seq > self.read_seq:
+                # The previous value was never read
+                self.dropped += 1
+            self.value = value
+            self.seq += 1
+            self.cond.notify_all()
+
+    def get(self, after_seq=0, timeout=None):
+        # Returns (seq, value) for the newest value after after_seq, or
+        # (after_seq, None) on timeout or once the slot is closed
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > after_seq or self.closed, timeout)
+            if self.seq <= after_seq:
+                return after_seq, None
+            self.read_seq = max(self.read_seq, self.seq)
+            self.cond.notify_all()
+            return self.seq, self.value
+
+    def wait_taken(self, timeout=None):
+        # Lets a writer that must not drop values wait until the last one was read
+        with self.cond:
+            return self.cond.wait_for(lambda: self.read_seq >= self.seq or self.closed, timeout)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+# Cheap "has the picture changed?" check in front of the detector: frames are
+# shrunk to a tiny grayscale thumbnail and compared with the thumbnail of the
+# last frame that was actually inferred. Comparing against that reference
+# (not the previous frame) lets slow drift add up until it crosses the
+# threshold; max_reuse forces a fresh inference now and then regardless.
+class SceneChangeDetector:
+    def __init__(self, threshold=4.0, size=(32, 24), max_reuse=5.0):
+        self.threshold = threshold
+        self.size = size
+        self.max_reuse = max_reuse
+        self.reference = None
+        self.reference_time = 0.0
+        self.checks = 0
+        self.skipped = 0
+        self.last_score = 0.0
+
+    def _thumb(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+    def changed(self, frame):
+        self.checks += 1
+        thumb = self._thumb(frame)
+        now = time.monotonic()
+        if self.reference is not None and now - self.reference_time < self.max_reuse:
+            self.last_score = float(np.abs(thumb - self.reference).mean())
+            if self.last_score < self.threshold:
+                self.skipped += 1
+                return False
+        self.reference = thumb
+        self.reference_time = now
+        return True
+
+    def invalidate(self):
+        self.reference = None
+
+    def snapshot(self):
+        return {
+            'checks': self.checks,
+            'reused': self.skipped,
+            'skip_ratio': round(self.skipped / self.checks, 3) if self.checks else 0.0,
+            'last_change_score': round(self.last_score, 2)
+        }
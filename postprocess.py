@@ -0,0 +1,45 @@
+import json
+
+import numpy as np
+
+
+# Per-class response fields for one model, built once when the model (or the
+# knowledge base) loads, so turning detections into JSON never looks up names
+# or disease text per box. Each record layout matches one of the app's
+# response formats; fragments hold each class's info already serialized.
+class ClassTable:
+    def __init__(self, names, knowledge):
+        size = max(names, default=-1) + 1
+        self.names = [names.get(i, str(i)) for i in range(size)]
+        info = [knowledge.lookup(name) for name in self.names]
+        self.missing, self.unused = knowledge.validate(names)
+        self.camera = [{'class': name, 'class_id': i, 'diagnosis': d['diagnosis'], 'remedy': d['remedy']}
+                       for i, (name, d) in enumerate(zip(self.names, info))]
+        self.upload = [{'class': name, 'Diagnosis': d['diagnosis'], 'Remedy': d['remedy']}
+                       for name, d in zip(self.names, info)]
+        self.score = [{'class': name, 'diagnosis': d['diagnosis'], 'remedy': d['remedy']}
+                      for name, d in zip(self.names, info)]
+        # Class-id-only records for compact responses, and the side table they refer to
+        self.ids = [{'class_id': i} for i in range(size)]
+        self.info = [{'name': name, 'diagnosis': d['diagnosis'], 'remedy': d['remedy']}
+                     for name, d in zip(self.names, info)]
+        self.fragments = [json.dumps(d) for d in self.info]
+
+    def __len__(self):
+        return len(self.names)
+
+
+# Build response dicts for a whole Detections at once: arrays are filtered and
+# converted to Python lists in a few bulk calls, then each box only copies its
+# class record and adds confidence and bbox
+def detection_records(det, per_class, conf_digits=None):
+    scores, class_ids, boxes = det.scores, det.class_ids, det.boxes
+    keep = (class_ids >= 0) & (class_ids < len(per_class))
+    if not keep.all():
+        scores, class_ids, boxes = scores[keep], class_ids[keep], boxes[keep]
+    if conf_digits is not None:
+        scores = np.round(scores.astype(np.float64), conf_digits)
+    confs = scores.tolist()
+    classes = class_ids.tolist()
+    bboxes = boxes.astype(int).tolist()
+    return [dict(per_class[c], confidence=s, bbox=b) for c, s, b in zip(classes, confs, bboxes)]
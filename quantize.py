@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from backends import OnnxBackend, box_iou, export_onnx, int8_paths, preprocess
+from benchmark import load_images, time_backend
+
+
+# Feeds letterboxed sample leaves to the ONNX Runtime calibrator one at a time
+class LeafCalibrationReader:
+    def __init__(self, images, input_name, imgsz=640):
+        self.batches = iter([{input_name: preprocess([image], imgsz)[0]} for image in images])
+
+    def get_next(self):
+        return next(self.batches, None)
+
+
+def quantize(onnx_path, quant_path, images, imgsz=640):
+    import onnx
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    model = onnx.load(onnx_path)
+    input_name = model.graph.input[0].name
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = os.path.join(tmp, 'prepared.onnx')
+        quant_pre_process(onnx_path, prepared)
+        # Only Conv/MatMul are quantized; the box decode and class sigmoid in the
+        # head stay in float, which is where INT8 hurts YOLO accuracy the most
+        quantize_static(
+            prepared, quant_path, LeafCalibrationReader(images, input_name, imgsz),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            op_types_to_quantize=['Conv', 'MatMul'],
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+
+    # Keep names/imgsz metadata so the backend can read class names
+    quant = onnx.load(quant_path)
+    del quant.metadata_props[:]
+    quant.metadata_props.extend(model.metadata_props)
+    onnx.save(quant, quant_path)
+
+
+def compare(fp32, int8, images, names, conf=0.5, match_iou=0.5):
+    per_class = {}
+    for image in images:
+        a = fp32.predict([image], conf)[0]
+        b = int8.predict([image], conf)[0]
+        ious = box_iou(a.boxes, b.boxes) if len(a) and len(b) else np.zeros((len(a), len(b)))
+        ious[a.class_ids[:, None] != b.class_ids[None, :]] = 0
+        used = set()
+        for cls in set(a.class_ids.tolist()) | set(b.class_ids.tolist()):
+            stats = per_class.setdefault(names.get(cls, str(cls)), {
+                'fp32': 0, 'int8': 0, 'matched': 0, 'iou': [], 'conf_drift': []})
+            stats['fp32'] += int((a.class_ids == cls).sum())
+            stats['int8'] += int((b.class_ids == cls).sum())
+        # Greedy match in FP32 confidence order
+        for i in np.argsort(-a.scores):
+            row = ious[i].copy()
+            row[list(used)] = 0
+            j = int(row.argmax()) if row.size else -1
+            if j < 0 or row[j] < match_iou:
+                continue
+            used.add(j)
+            stats = per_class[names.get(int(a.class_ids[i]), str(a.class_ids[i]))]
+            stats['matched'] += 1
+            stats['iou'].append(float(row[j]))
+            stats['conf_drift'].append(float(b.scores[j] - a.scores[i]))
+
+    report = {}
+    for name, stats in sorted(per_class.items()):
+        report[name] = {
+            'fp32_detections': stats['fp32'],
+            'int8_detections': stats['int8'],
+            'matched': stats['matched'],
+            'mean_iou': float(np.mean(stats['iou'])) if stats['iou'] else None,
+            'mean_conf_drift': float(np.mean(stats['conf_drift'])) if stats['conf_drift'] else None,
+            'max_abs_conf_drift': float(np.max(np.abs(stats['conf_drift']))) if stats['conf_drift'] else None,
+        }
+    return report, per_class
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post-training INT8 quantization with an accuracy/latency report")
+    parser.add_argument('weights', nargs='?', default='best.pt')
+    parser.add_argument('--calib', default='uploads', help="folder of sample leaf images for calibration")
+    parser.add_argument('--eval', default=None, help="folder for the FP32 vs INT8 comparison (default: --calib)")
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--conf', type=float, default=0.5)
+    parser.add_argument('--min-match-rate', type=float, default=0.95)
+    parser.add_argument('--min-iou', type=float, default=0.85)
+    parser.add_argument('--max-conf-drift', type=float, default=0.05)
+    parser.add_argument('--min-speedup', type=float, default=1.0)
+    args = parser.parse_args()
+
+    onnx_path = export_onnx(args.weights) if args.weights.endswith('.pt') else args.weights
+    quant_path, report_path = int8_paths(args.weights)
+
+    calib_images = load_images(args.calib, args.limit)
+    eval_images = load_images(args.eval, args.limit) if args.eval else calib_images
+    if not calib_images or not eval_images:
+        parser.error("No calibration/evaluation images found")
+
+    print(f"Calibrating on {len(calib_images)} images...")
+    quantize(onnx_path, quant_path, calib_images)
+
+    fp32 = OnnxBackend(onnx_path)
+    int8 = OnnxBackend(quant_path)
+    classes, per_class = compare(fp32, int8, eval_images, fp32.names, args.conf)
+    fp32_time = time_backend(fp32, eval_images, args.conf)
+    int8_time = time_backend(int8, eval_images, args.conf)
+
+    total = sum(s['fp32'] for s in per_class.values())
+    matched = sum(s['matched'] for s in per_class.values())
+    ious = [v for s in per_class.values() for v in s['iou']]
+    drifts = [abs(v) for s in per_class.values() for v in s['conf_drift']]
+    summary = {
+        'match_rate': matched / total if total else 1.0,
+        'mean_iou': float(np.mean(ious)) if ious else 1.0,
+        'mean_abs_conf_drift': float(np.mean(drifts)) if drifts else 0.0,
+        'fp32_p50_ms': fp32_time['p50_ms'],
+        'int8_p50_ms': int8_time['p50_ms'],
+        'speedup': fp32_time['p50_ms'] / int8_time['p50_ms'],
+    }
+    checks = {
+        'match_rate': summary['match_rate'] >= args.min_match_rate,
+        'mean_iou': summary['mean_iou'] >= args.min_iou,
+        'mean_abs_conf_drift': summary['mean_abs_conf_drift'] <= args.max_conf_drift,
+        'speedup': summary['speedup'] >= args.min_speedup,
+    }
+    report = {
+        'model': quant_path,
+        'reference': onnx_path,
+        'images': len(eval_images),
+        'summary': summary,
+        'checks': checks,
+        'passed': all(checks.values()),
+        'classes': classes,
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'class':35s} {'fp32':>5s} {'int8':>5s} {'match':>5s} {'IoU':>6s} {'drift':>7s}")
+    for name, c in classes.items():
+        iou = f"{c['mean_iou']:.3f}" if c['mean_iou'] is not None else '-'
+        drift = f"{c['mean_conf_drift']:+.3f}" if c['mean_conf_drift'] is not None else '-'
+        print(f"{name:35s} {c['fp32_detections']:5d} {c['int8_detections']:5d} {c['matched']:5d} {iou:>6s} {drift:>7s}")
+    for key, value in summary.items():
+        print(f"{key}: {value:.3f}")
+    print(f"Gate {'PASSED' if report['passed'] else 'FAILED'}: {checks}")
+    print(f"Report written to {report_path}")
+    raise SystemExit(0 if report['passed'] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+# Box thickness grows with the image (2 px up to ~670 px, 10 px for a 12 MP
+# photo) and labels with it, so annotations stay readable when a large image
+# is shown scaled down; FONT_SCALE is the label size at the minimum thickness
+FONT_SCALE = 0.5
+BOX_THICKNESS = 2
+
+# One colour per class id, computed once (same colours the per-box
+# RandomState used to produce), plus a readable text colour for each
+PALETTE = np.array([np.random.RandomState(i).randint(0, 255, 3) for i in range(256)], dtype=np.uint8)
+TEXT_COLORS = np.where((PALETTE @ np.array([0.114, 0.587, 0.299]) > 150)[:, None], 0, 255).astype(np.uint8).repeat(3, 1)
+
+# Rendered label images keyed by (text, class colour index, line width).
+# Class names and two-decimal confidences are separate sprites, so the cache
+# stays small (one per class name plus at most 101 confidences per class, for
+# each of the few line widths in use).
+_sprites = {}
+
+
+def class_color(cls):
+    return tuple(int(c) for c in PALETTE[int(cls) % len(PALETTE)])
+
+
+def line_width(image):
+    h, w = image.shape[:2]
+    return max(round((h + w) / 2 * 0.003), BOX_THICKNESS)
+
+
+def label_sprite(text, cls, lw=BOX_THICKNESS):
+    key = (text, int(cls) % len(PALETTE), lw)
+    sprite = _sprites.get(key)
+    if sprite is None:
+        font_scale = FONT_SCALE * lw / BOX_THICKNESS
+        thickness = max(lw // 2, 1)
+        pad = 2 * lw // BOX_THICKNESS
+        (w, h), baseline = cv2.getTextSize(text, FONT, font_scale, thickness)
+        sprite = np.empty((h + baseline + 2 * pad, w + 2 * pad, 3), dtype=np.uint8)
+        sprite[:] = PALETTE[key[1]]
+        color = tuple(int(c) for c in TEXT_COLORS[key[1]])
+        cv2.putText(sprite, text, (pad, h + pad), FONT, font_scale, color, thickness, cv2.LINE_AA)
+        _sprites[key] = sprite
+    return sprite
+
+
+def _blit(image, sprite, x, y):
+    # Copy sprite onto image at (x, y), clipped to the image
+    h, w = image.shape[:2]
+    sh, sw = sprite.shape[:2]
+    x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + sw, w), min(y + sh, h)
+    if x1 > x0 and y1 > y0:
+        image[y0:y1, x0:x1] = sprite[y0 - y:y1 - y, x0 - x:x1 - x]
+    return x + sw
+
+
+# Draw boxes and "name conf" labels onto image in place; boxes are given in
+# the coordinates of the image they were detected on and multiplied by scale
+def draw_detections(image, det, names, scale=1.0):
+    boxes = det.boxes * scale if scale != 1.0 else det.boxes
+    lw = line_width(image)
+    for (x1, y1, x2, y2), conf_val, cls in zip(boxes.astype(int).tolist(), det.scores.tolist(), det.class_ids.tolist()):
+        cv2.rectangle(image, (x1, y1), (x2, y2), class_color(cls), lw)
+        name = label_sprite(names.get(cls, str(cls)), cls, lw)
+        conf = label_sprite(f"{conf_val:.2f}", cls, lw)
+        # Label sits on top of the box, or just inside it at the top edge
+        y = y1 - name.shape[0] if y1 >= name.shape[0] else y1
+        _blit(image, conf, _blit(image, name, x1, y), y)
+    return image
+
+
+# Downscaled annotated copy (longest side max_side) for previews; boxes are
+# drawn after resizing so labels stay readable and only the small image is drawn on
+def annotated_preview(image, det, names, max_side=640):
+    h, w = image.shape[:2]
+    scale = min(1.0, max_side / max(h, w))
+    if scale == 1.0:
+        return draw_detections(image.copy(), det, names)
+    small = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    return draw_detections(small, det, names, scale)
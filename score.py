@@ -0,0 +1,239 @@
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import cv2
+import numpy as np
+
+from backends import Detections, load_backend
+from ingest import decode_image
+from knowledge import KnowledgeBase
+from postprocess import ClassTable, detection_records
+from render import annotated_preview, draw_detections
+from storage import IMAGE_EXTS
+from tiling import merge_tiles, tile_inputs
+
+CSV_FIELDS = ['path', 'width', 'height', 'class', 'confidence', 'x1', 'y1', 'x2', 'y2', 'diagnosis', 'remedy']
+
+
+def find_images(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTS:
+                yield os.path.join(dirpath, name)
+
+
+def decode(path, target=None, full_above=None):
+    # Runs in a worker process; decoded the same way as /upload
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return path, None, None
+    image, scale = decode_image(data, target, full_above)
+    return path, image, scale
+
+
+def decoded_images(paths, workers, window, decode=decode):
+    # Ordered decode through a process pool with a bounded number of images in flight
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        paths = iter(paths)
+        while True:
+            while len(pending) < window:
+                path = next(paths, None)
+                if path is None:
+                    break
+                pending.append(pool.submit(decode, path))
+            if not pending:
+                return
+            yield pending.popleft().result()
+
+
+def done_paths(out_path):
+    # Paths already scored by a previous run, so it can resume where it stopped
+    if not os.path.exists(out_path):
+        return set()
+    done = set()
+    with open(out_path, newline='') as f:
+        if out_path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                done.add(row['path'])
+        else:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['path'])
+                except (ValueError, KeyError):
+                    # A torn last line from an interrupted run is rescored
+                    pass
+    return done
+
+
+def records(path, image, scale, det, classes):
+    # Size and boxes in the full-size upright image, like /upload
+    sx, sy = scale
+    h, w = image.shape[:2]
+    full_det = Detections(det.boxes * np.array([sx, sy, sx, sy], np.float32), det.scores, det.class_ids)
+    out = detection_records(full_det, classes.score, conf_digits=4)
+    return {'path': path, 'width': round(w * sx), 'height': round(h * sy), 'detections': out}
+
+
+# Writes result rows and optional annotated images off the inference thread
+class ResultWriter(threading.Thread):
+    def __init__(self, out_path, root, annotated_dir=None, names=None, annotated_max_side=None):
+        super().__init__(daemon=True)
+        self.root = root
+        self.annotated_dir = annotated_dir
+        self.annotated_max_side = annotated_max_side
+        self.names = names or {}
+        self.items = queue.Queue(maxsize=256)
+        self.is_csv = out_path.endswith('.csv')
+        new_file = not os.path.exists(out_path) or os.path.getsize(out_path) == 0
+        self.file = open(out_path, 'a', newline='')
+        if self.is_csv:
+            self.csv = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+            if new_file:
+                self.csv.writeheader()
+
+    def put(self, path, image, det, record):
+        self.items.put((path, image, det, record))
+
+    def close(self):
+        self.items.put(None)
+        self.join()
+        self.file.close()
+
+    def _write(self, record):
+        if not self.is_csv:
+            self.file.write(json.dumps(record) + '\n')
+            return
+        base = {'path': record['path'], 'width': record['width'], 'height': record['height']}
+        # Images without detections still get a row so resume skips them
+        for d in record['detections'] or [None]:
+            row = dict(base)
+            if d is not None:
+                row.update({'class': d['class'], 'confidence': d['confidence'],
+                            'diagnosis': d['diagnosis'], 'remedy': d['remedy']})
+                row.update(zip(['x1', 'y1', 'x2', 'y2'], d['bbox']))
+            self.csv.writerow(row)
+
+    def run(self):
+        while True:
+            item = self.items.get()
+            if item is None:
+                self.file.flush()
+                return
+            path, image, det, record = item
+            if self.annotated_dir:
+                out = os.path.join(self.annotated_dir, os.path.relpath(path, self.root))
+                os.makedirs(os.path.dirname(out), exist_ok=True)
+                if self.annotated_max_side:
+                    annotated = annotated_preview(image, det, self.names, self.annotated_max_side)
+                else:
+                    annotated = draw_detections(image, det, self.names)
+                cv2.imwrite(out, annotated)
+            self._write(record)
+            self.file.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every image under a directory tree")
+    parser.add_argument('root')
+    parser.add_argument('--out', default='scores.jsonl', help="results file (.jsonl or .csv)")
+    parser.add_argument('--annotated', default=None, help="also write annotated images under this folder")
+    parser.add_argument('--annotated-max-side', type=int, default=None,
+                        help="downscale annotated images to this longest side")
+    parser.add_argument('--backend', default=os.environ.get('MODEL_BACKEND', 'ultralytics'))
+    parser.add_argument('--model', default=os.environ.get('MODEL_PATH', 'best.pt'))
+    parser.add_argument('--conf', type=float, default=0.5)
+    parser.add_argument('--batch', type=int, default=16)
+    # Same defaults as the app's TILE_* and DECODE_TARGET_SIZE settings
+    parser.add_argument('--no-tiles', action='store_true', help="don't tile large images")
+    parser.add_argument('--tile-threshold', type=int, default=1600, help="tile images with a longer side")
+    parser.add_argument('--tile-size', type=int, default=640)
+    parser.add_argument('--tile-overlap', type=float, default=0.2)
+    parser.add_argument('--tile-merge-threshold', type=float, default=0.5)
+    parser.add_argument('--full-decode', action='store_true', help="don't decode JPEGs at reduced size")
+    parser.add_argument('--decode-target', type=int, default=640)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="decode processes")
+    parser.add_argument('--no-resume', action='store_true', help="rescore images already in --out")
+    parser.add_argument('--report-every', type=int, default=500)
+    args = parser.parse_args()
+
+    if args.no_resume and os.path.exists(args.out):
+        os.remove(args.out)
+    skip = done_paths(args.out)
+    paths = [p for p in find_images(args.root) if p not in skip]
+    print(f"{len(paths)} images to score ({len(skip)} already done)")
+    if not paths:
+        return
+
+    backend = load_backend(args.backend, args.model)
+    knowledge = KnowledgeBase()
+    knowledge.load()
+    classes = ClassTable(backend.names, knowledge)
+    if classes.missing:
+        print(f"No disease info for: {', '.join(classes.missing)}")
+    writer = ResultWriter(args.out, args.root, args.annotated, backend.names, args.annotated_max_side)
+    writer.start()
+
+    tile_threshold = None if args.no_tiles else args.tile_threshold
+    decode_target = None if args.full_decode else args.decode_target
+    start = time.perf_counter()
+    infer_time = 0.0
+    scored = failed = tiles = 0
+    batch = []
+
+    def flush(batch):
+        nonlocal infer_time, scored, tiles
+        # Full images and their tiles go through the model together, --batch at a time
+        inputs = [tile_inputs(image, tile_threshold, args.tile_size, args.tile_overlap) for _, image, _ in batch]
+        crops = [crop for image_crops, _ in inputs for crop in image_crops]
+        t0 = time.perf_counter()
+        results = []
+        for i in range(0, len(crops), args.batch):
+            results += backend.predict(crops[i:i + args.batch], args.conf)
+        infer_time += time.perf_counter() - t0
+        pos = 0
+        for (path, image, scale), (image_crops, offsets) in zip(batch, inputs):
+            det = merge_tiles(results[pos:pos + len(image_crops)], offsets, args.tile_merge_threshold)
+            pos += len(image_crops)
+            tiles += len(image_crops) - 1
+            writer.put(path, image, det, records(path, image, scale, det, classes))
+        before = scored
+        scored += len(batch)
+        if scored // args.report_every != before // args.report_every:
+            elapsed = time.perf_counter() - start
+            print(f"{scored}/{len(paths)} images, {scored / elapsed:.1f} img/s")
+
+    try:
+        decode_one = partial(decode, target=decode_target, full_above=tile_threshold)
+        for path, image, scale in decoded_images(paths, args.workers, args.batch * 4, decode_one):
+            if image is None:
+                failed += 1
+                print(f"Could not read {path}")
+                continue
+            batch.append((path, image, scale))
+            if len(batch) >= args.batch:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} images in {elapsed:.1f}s ({scored / elapsed:.1f} img/s, "
+          f"inference {infer_time / elapsed:.0%} of wall time), {tiles} tiles, {failed} unreadable")
+
+
+if __name__ == "__main__":
+    main()
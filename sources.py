@@ -0,0 +1,159 @@
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import cv2
+
+from pipeline import LatestSlot
+
+
+def source_kind(source):
+    if isinstance(source, int):
+        return 'webcam'
+    if '://' in source:
+        return 'stream'
+    return 'file'
+
+
+def display_source(source):
+    # Source as shown in /cameras, /stats and logs: stream URLs lose their
+    # user:password@ and query string, which often carry credentials
+    if source_kind(source) != 'stream':
+        return str(source)
+    parts = urlsplit(source)
+    host = parts.hostname or ''
+    if ':' in host:
+        host = f'[{host}]'
+    if parts.port is not None:
+        host = f'{host}:{parts.port}'
+    return urlunsplit((parts.scheme, host, parts.path, '', ''))
+
+
+# Frame source for the live pipeline: a webcam index, a video file or an
+# RTSP/HTTP URL. A decode thread reads frames into a latest-value slot so the
+# consumer always gets the freshest one. Live sources that drop are reopened
+# with exponential backoff. Files are replayed either in real time (paced by
+# their frame rate) or as fast as the consumer takes frames, without dropping
+# any, which makes a repeatable benchmark of the live path.
+class FrameSource:
+    def __init__(self, source, pacing='realtime', loop=False, reconnect_min=0.5, reconnect_max=30.0):
+        self.source = source
+        self.kind = source_kind(source)
+        self.pacing = pacing
+        self.loop = loop
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.cap = None
+        self.slot = LatestSlot()
+        self.thread = None
+        self.running = False
+        self.ended = False
+        self.status = 'closed'
+        self.source_fps = 0.0
+        self.frames_read = 0
+        self.reconnects = 0
+        self.failures = 0
+
+    def _open_capture(self):
+        if self.kind == 'stream':
+            cap = cv2.VideoCapture(self.source, cv2.CAP_FFMPEG)
+        else:
+            cap = cv2.VideoCapture(self.source)
+        if self.kind == 'webcam':
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            time.sleep(0.2)
+        if self.kind != 'file':
+            # Keep the driver from buffering frames we would only read late
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.source_fps = fps if 0 < fps < 1000 else 30.0
+        return cap
+
+    def open(self):
+        self.cap = self._open_capture()
+        if self.cap is None:
+            return False
+        self.running = True
+        self.status = 'connected'
+        self.thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def read(self, timeout=0.5):
+        # Newest decoded frame, or None on timeout or once the source has ended
+        seq, frame = self.slot.get(self.slot.read_seq, timeout=timeout)
+        return frame
+
+    def close(self):
+        self.running = False
+        self.slot.close()
+        if self.thread:
+            self.thread.join(timeout=2)
+        if self.cap:
+            self.cap.release()
+        if not self.ended:
+            self.status = 'closed'
+
+    def _reconnect(self):
+        # Reopen a dropped live source, doubling the wait after each failure
+        self.status = 'reconnecting'
+        self.cap.release()
+        delay = self.reconnect_min
+        while self.running:
+            time.sleep(delay)
+            cap = self._open_capture()
+            if cap is not None:
+                self.cap = cap
+                self.reconnects += 1
+                self.status = 'connected'
+                print(f"Reconnected to {display_source(self.source)}")
+                return True
+            delay = min(delay * 2, self.reconnect_max)
+        return False
+
+    def _decode_loop(self):
+        start = time.monotonic()
+        played = 0
+        while self.running:
+            if self.kind == 'file' and self.pacing == 'fast':
+                # Only decode the next frame once the last one was taken
+                if not self.slot.wait_taken(timeout=0.5):
+                    continue
+            ret, frame = self.cap.read()
+            if not ret:
+                if self.kind == 'file':
+                    if self.loop and played:
+                        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        start, played = time.monotonic(), 0
+                        continue
+                    self.ended = True
+                    self.status = 'ended'
+                    break
+                self.failures += 1
+                if not self._reconnect():
+                    break
+                continue
+            if self.kind == 'file' and self.pacing == 'realtime':
+                delay = start + played / self.source_fps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            played += 1
+            self.frames_read += 1
+            self.slot.put(frame)
+        self.slot.close()
+
+    def snapshot(self):
+        return {
+            'kind': self.kind,
+            'status': self.status,
+            'pacing': self.pacing if self.kind == 'file' else 'live',
+            'source_fps': round(self.source_fps, 2),
+            'frames_read': self.frames_read,
+            'dropped': self.slot.dropped,
+            'reconnects': self.reconnects,
+            'failures': self.failures
+        }
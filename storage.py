@@ -0,0 +1,123 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# <32 hex digest>[-variant].<ext>, e.g. 3f2a...9c.jpg or 3f2a...9c-annotated-1a2b3c4d.jpg
+KEY_RE = re.compile(r'^[0-9a-f]{32}(-[a-z0-9-]+)?\.[a-z0-9]{1,5}$')
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+
+
+def content_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def image_ext(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if ext in IMAGE_EXTS else '.jpg'
+
+
+# Content-addressed file store for uploads and their derivatives. Files live in
+# two-character shard directories, identical content is stored once, and the
+# store is kept under a total-bytes and last-access age budget with LRU eviction.
+class UploadStore:
+    def __init__(self, root, max_bytes=2 * 1024 ** 3, max_age=7 * 24 * 3600):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.index = OrderedDict()  # key -> [size, last_access], oldest first
+        self.total_bytes = 0
+        self.stats = {'writes': 0, 'dedup_hits': 0, 'evictions': 0, 'expired': 0}
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def key_for(digest, ext, variant=None):
+        return f"{digest}-{variant}{ext}" if variant else f"{digest}{ext}"
+
+    @staticmethod
+    def valid_key(key):
+        return bool(KEY_RE.match(key))
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _scan(self):
+        # Rebuild the index from disk, oldest modification first
+        entries = []
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_dir):
+                continue
+            for entry in os.scandir(shard_dir):
+                if entry.is_file() and self.valid_key(entry.name):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, entry.name, st.st_size))
+        now_wall, now = time.time(), time.monotonic()
+        for mtime, key, size in sorted(entries):
+            self.index[key] = [size, now - (now_wall - mtime)]
+            self.total_bytes += size
+
+    def exists(self, key):
+        with self.lock:
+            return key in self.index
+
+    def put(self, key, data):
+        with self.lock:
+            if key in self.index:
+                self.index[key][1] = time.monotonic()
+                self.index.move_to_end(key)
+                self.stats['dedup_hits'] += 1
+                return False
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self.lock:
+            if key not in self.index:
+                self.total_bytes += len(data)
+            self.index[key] = [len(data), time.monotonic()]
+            self.index.move_to_end(key)
+            self.stats['writes'] += 1
+            evicted = self._evict()
+        self._unlink(evicted)
+        return True
+
+    def get_path(self, key):
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            entry[1] = time.monotonic()
+            self.index.move_to_end(key)
+        return self.path(key)
+
+    def _evict(self):
+        evicted = []
+        now = time.monotonic()
+        while self.index:
+            key, (size, last_access) = next(iter(self.index.items()))
+            expired = self.max_age and now - last_access > self.max_age
+            if not expired and self.total_bytes <= self.max_bytes:
+                break
+            del self.index[key]
+            self.total_bytes -= size
+            self.stats['expired' if expired else 'evictions'] += 1
+            evicted.append(key)
+        return evicted
+
+    def _unlink(self, keys):
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, files=len(self.index), bytes=self.total_bytes)
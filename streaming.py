@@ -0,0 +1,45 @@
+import threading
+
+
+# Holds the latest value of a stream (an encoded JPEG, a serialized detections
+# update, ...). The producer publishes each value once; every viewer waits on
+# the condition for a sequence number newer than the one it last sent, so all
+# viewers share the same bytes and a slow viewer simply skips values instead
+# of holding anyone else up.
+class Broadcaster:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.value = None
+        self.seq = 0
+        self.viewers = 0
+        self.lock = threading.Lock()
+
+    def publish(self, value):
+        with self.cond:
+            self.value = value
+            self.seq += 1
+            self.cond.notify_all()
+
+    def clear(self):
+        with self.cond:
+            self.value = None
+
+    def latest(self):
+        with self.cond:
+            return self.seq, self.value
+
+    def wait(self, after_seq, timeout=None):
+        # Returns (seq, value) for a value newer than after_seq, or (after_seq, None) on timeout
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > after_seq and self.value is not None, timeout)
+            if self.seq <= after_seq or self.value is None:
+                return after_seq, None
+            return self.seq, self.value
+
+    def add_viewer(self, delta):
+        with self.lock:
+            self.viewers += delta
+
+    def snapshot(self):
+        with self.cond:
+            return {'published': self.seq, 'viewers': self.viewers, 'has_value': self.value is not None}
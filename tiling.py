@@ -0,0 +1,69 @@
+import numpy as np
+
+from backends import Detections
+
+
+def tile_starts(length, tile, step):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    # Last tile is flush with the far edge instead of running past it
+    starts.append(length - tile)
+    return starts
+
+
+def tile_windows(width, height, tile=640, overlap=0.2):
+    # Top-left corners of overlapping tile x tile crops covering the image
+    step = max(1, int(tile * (1 - overlap)))
+    return [(x, y) for y in tile_starts(height, tile, step) for x in tile_starts(width, tile, step)]
+
+
+def tile_inputs(image, threshold=1600, tile=640, overlap=0.2):
+    # (crops, offsets) to run for one image: the full image first, then the
+    # overlapping tiles when its longest side is above threshold (None: never)
+    h, w = image.shape[:2]
+    if threshold is None or max(h, w) <= threshold:
+        return [image], [(0, 0)]
+    windows = tile_windows(w, h, tile, overlap)
+    return [image] + [image[y:y + tile, x:x + tile] for x, y in windows], [(0, 0)] + windows
+
+
+def fast_nms(boxes, scores, class_ids, thres=0.5, metric='ios', max_boxes=3000):
+    # Matrix NMS in one pass: a box is dropped if any higher-scoring box of the
+    # same class overlaps it by more than thres. 'ios' (intersection over the
+    # smaller box) also removes the partial boxes a lesion cut by a tile edge
+    # leaves behind inside the full box from the neighbouring tile.
+    order = scores.argsort()[::-1][:max_boxes]
+    b, c = boxes[order], class_ids[order]
+    lt = np.maximum(b[:, None, :2], b[None, :, :2])
+    rb = np.minimum(b[:, None, 2:], b[None, :, 2:])
+    inter = (rb - lt).clip(0).prod(2)
+    area = (b[:, 2:] - b[:, :2]).clip(0).prod(1)
+    if metric == 'ios':
+        denom = np.minimum(area[:, None], area[None, :])
+    else:
+        denom = area[:, None] + area[None, :] - inter
+    overlap = inter / (denom + 1e-9)
+    overlap[c[:, None] != c[None, :]] = 0
+    # Row i only suppresses lower-scoring columns j > i
+    overlap = np.triu(overlap, k=1)
+    return order[overlap.max(0, initial=0) <= thres]
+
+
+# Merge per-tile Detections into one for the whole image; offsets are the
+# (x, y) tile origins, (0, 0) for a pass over the full image. A lone full-image
+# pass (an image that wasn't tiled) is returned as is.
+def merge_tiles(results, offsets, thres=0.5, metric='ios'):
+    if len(results) == 1 and tuple(offsets[0]) == (0, 0):
+        return results[0]
+    boxes, scores, class_ids = [], [], []
+    for det, (x, y) in zip(results, offsets):
+        if len(det):
+            boxes.append(det.boxes + np.array([x, y, x, y], dtype=det.boxes.dtype))
+            scores.append(det.scores)
+            class_ids.append(det.class_ids)
+    if not boxes:
+        return Detections()
+    boxes, scores, class_ids = np.concatenate(boxes), np.concatenate(scores), np.concatenate(class_ids)
+    keep = fast_nms(boxes, scores, class_ids, thres, metric)
+    return Detections(boxes[keep], scores[keep], class_ids[keep])
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+
+
+# Moves boxes from the last inferred frame onto newer frames with sparse
+# Lucas-Kanade optical flow, so the detector doesn't have to run every frame.
+# Each box follows the median motion (and spread change) of the corner points
+# found inside it; boxes with too few tracked points keep their last position.
+class FlowTracker:
+    def __init__(self, scale=0.5, points_per_box=25, min_points=3):
+        self.scale = scale
+        self.points_per_box = points_per_box
+        self.min_points = min_points
+        self.prev = None
+        self.boxes = np.zeros((0, 4), np.float32)
+        self.lk_params = dict(winSize=(15, 15), maxLevel=3,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+    def _gray(self, frame):
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def reset(self, frame, boxes):
+        # Re-anchor on a frame the detector has just seen
+        self.prev = self._gray(frame)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4).copy()
+
+    def update(self, frame):
+        gray = self._gray(frame)
+        prev, self.prev = self.prev, gray
+        if prev is None or len(self.boxes) == 0:
+            return self.boxes
+
+        boxes = self.boxes * self.scale
+        h, w = prev.shape
+        mask = np.zeros_like(prev)
+        for x1, y1, x2, y2 in boxes.astype(int):
+            mask[max(0, y1):min(h, y2), max(0, x1):min(w, x2)] = 255
+        p0 = cv2.goodFeaturesToTrack(prev, maxCorners=self.points_per_box * len(boxes),
+                                     qualityLevel=0.01, minDistance=3, mask=mask)
+        if p0 is None:
+            return self.boxes
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(prev, gray, p0, None, **self.lk_params)
+        ok = status.reshape(-1) == 1
+        p0, p1 = p0.reshape(-1, 2)[ok], p1.reshape(-1, 2)[ok]
+        if len(p0) == 0:
+            return self.boxes
+
+        # (points, boxes) membership matrix
+        inside = ((p0[:, None, 0] >= boxes[None, :, 0]) & (p0[:, None, 0] <= boxes[None, :, 2]) &
+                  (p0[:, None, 1] >= boxes[None, :, 1]) & (p0[:, None, 1] <= boxes[None, :, 3]))
+        moved = boxes.copy()
+        for i in np.flatnonzero(inside.sum(0) >= self.min_points):
+            a, b = p0[inside[:, i]], p1[inside[:, i]]
+            shift = np.median(b - a, axis=0)
+            ca, cb = np.median(a, axis=0), np.median(b, axis=0)
+            spread_a = np.median(np.linalg.norm(a - ca, axis=1))
+            spread_b = np.median(np.linalg.norm(b - cb, axis=1))
+            scale = np.clip(spread_b / spread_a, 0.8, 1.25) if spread_a > 1e-3 else 1.0
+            center = (boxes[i, :2] + boxes[i, 2:]) / 2 + shift
+            half = (boxes[i, 2:] - boxes[i, :2]) / 2 * scale
+            moved[i] = np.concatenate([center - half, center + half])
+
+        self.boxes = moved / self.scale
+        fh, fw = frame.shape[:2]
+        self.boxes[:, [0, 2]] = self.boxes[:, [0, 2]].clip(0, fw)
+        self.boxes[:, [1, 3]] = self.boxes[:, [1, 3]].clip(0, fh)
+        return self.boxes